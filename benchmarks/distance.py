@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# Compares the per call cost of geopy's ellipsoidal distance, which
+# LocationClass.distance_to used to call, with game.distance's haversine, and
+# with the numpy batch API for many to many distances.
+#
+#   python benchmarks/distance.py [points]
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from game.distance import ellipsoidal, haversine, pairwise, numpy
+
+
+def random_points(count, rand):
+    #Somewhere in Toronto
+    return [(rand.uniform(-79.6, -79.2), rand.uniform(43.58, 43.8))
+            for i in range(count)]
+
+
+def per_call(function, origins, destinations):
+    start = time.time()
+    for a, b in zip(origins, destinations):
+        function(a, b)
+    return (time.time() - start) / len(origins)
+
+
+def main(count=2000):
+    rand = random.Random(0)
+    origins = random_points(count, rand)
+    destinations = random_points(count, rand)
+
+    worst = max(abs(haversine(a, b) - ellipsoidal(a, b)) / ellipsoidal(a, b)
+                for a, b in zip(origins, destinations))
+    sys.stdout.write('%d pairs, worst haversine error %.3f%%\n'
+                     % (count, worst * 100))
+
+    for name, function in (('geopy', ellipsoidal),
+                           ('haversine', haversine)):
+        sys.stdout.write('%-10s %8.2f us/pair\n'
+                         % (name, per_call(function, origins,
+                                           destinations) * 1e6))
+
+    if numpy is not None:
+        start = time.time()
+        pairwise(origins, destinations)
+        elapsed = time.time() - start
+        sys.stdout.write('%-10s %8.3f us/pair (%d x %d matrix)\n'
+                         % ('pairwise', elapsed * 1e6 / count ** 2,
+                            count, count))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
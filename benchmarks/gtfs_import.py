@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# Compares the old GTFS import, which extracted the archive to a temporary
+# directory and split each line on commas, with game.gtfs reading the tables
+# straight out of the zip. The feed is synthetic, with TTC-like proportions.
+#
+#   python benchmarks/gtfs_import.py [stop_times rows]
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from zipfile import ZipFile, ZIP_DEFLATED
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from game.gtfs import find_stops
+
+ROUTE_LIST = [str(num) for num in range(501, 513)]
+STOPS_PER_TRIP = 40
+
+
+def old_find_stops(archive, route_list):
+    """ The parsing updatestops used before game.gtfs """
+    tmpdir = tempfile.mkdtemp()
+    try:
+        archive.extractall(tmpdir)
+        extracted = sum(os.path.getsize(os.path.join(tmpdir, name))
+                        for name in os.listdir(tmpdir))
+
+        trip_set = set()
+        trip_routes = {}
+        with open(tmpdir + '/trips.txt') as trips:
+            for trip in trips:
+                trip = trip.split(',')
+                if trip[3][0:3] in route_list:
+                    trip_set.add(trip[2])
+                    trip_routes[trip[2]] = trip[3][0:3]
+
+        stop_id_set = set()
+        stop_id_routes = {}
+        with open(tmpdir + '/stop_times.txt') as stop_times:
+            for stop_time in stop_times:
+                stop_time = stop_time.split(',')
+                if stop_time[0] in trip_set:
+                    stop_id_set.add(stop_time[3])
+                    stop_id_routes[stop_time[3]] = trip_routes[stop_time[0]]
+
+        stop_set = set()
+        with open(tmpdir + '/stops.txt') as stops:
+            for stop in stops:
+                stop = stop.split(',')
+                if stop[0] in stop_id_set:
+                    stop_set.add(tuple(stop[1:3] + stop[4:6] +
+                                       [stop_id_routes[stop[0]]]))
+        return stop_set, extracted
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def build_feed(stop_time_count):
+    rand = random.Random(0)
+    trip_count = stop_time_count / STOPS_PER_TRIP
+    stop_count = max(stop_time_count / 200, 100)
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'gtfs.zip')
+
+    with open(os.path.join(workdir, 'trips.txt'), 'w') as trips:
+        trips.write('route_id,service_id,trip_id,trip_headsign\n')
+        for trip in xrange(trip_count):
+            route = rand.choice(range(1, 200) + range(501, 513) * 4)
+            trips.write('%d,1,%d,%d SOMEWHERE TOWARDS ELSEWHERE\n'
+                        % (route, trip, route))
+    with open(os.path.join(workdir, 'stop_times.txt'), 'w') as stop_times:
+        stop_times.write('trip_id,arrival_time,departure_time,stop_id,'
+                         'stop_sequence\n')
+        for row in xrange(stop_time_count):
+            stop_times.write('%d,5:02:44,5:02:44,%d,%d,,0,0,1.5\n'
+                             % (row / STOPS_PER_TRIP,
+                                rand.randrange(stop_count),
+                                row % STOPS_PER_TRIP))
+    with open(os.path.join(workdir, 'stops.txt'), 'w') as stops:
+        stops.write('stop_id,stop_code,stop_name,stop_desc,stop_lat,'
+                    'stop_lon\n')
+        for stop in xrange(stop_count):
+            stops.write('%d,%05d,STREET %d AT AVENUE,,43.%06d,-79.%06d\n'
+                        % (stop, stop, stop, stop, stop))
+
+    with ZipFile(path, 'w', ZIP_DEFLATED) as archive:
+        for name in ('trips.txt', 'stop_times.txt', 'stops.txt'):
+            archive.write(os.path.join(workdir, name), name)
+            os.remove(os.path.join(workdir, name))
+    return workdir, path
+
+
+def measure(function, path):
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        with ZipFile(path) as archive:
+            result = function(archive)
+        elapsed = time.time() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+        os.write(write_end, '%f %d %d %d' % ((elapsed, peak) + result))
+        os._exit(0)
+    os.close(write_end)
+    result = os.read(read_end, 128)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    elapsed, peak, stops, extracted = result.split()
+    return float(elapsed), int(peak), int(stops), int(extracted)
+
+
+def main(stop_time_count=2000000):
+    workdir, path = build_feed(stop_time_count)
+    try:
+        sys.stdout.write('%d stop_times rows, %d KB archive\n'
+                         % (stop_time_count, os.path.getsize(path) / 1024))
+
+        def old(archive):
+            stops, extracted = old_find_stops(archive, ROUTE_LIST)
+            return len(stops), extracted
+
+        def new(archive):
+            return len(find_stops(archive, ROUTE_LIST)), 0
+
+        for name, function in (('extract', old), ('stream', new)):
+            elapsed, peak, stops, extracted = measure(function, path)
+            sys.stdout.write('%-8s %7.2f s %8d KB peak %8d KB on disk '
+                             '%6d stops\n' % (name, elapsed, peak,
+                                              extracted / 1024, stops))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
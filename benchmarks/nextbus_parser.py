@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# Compares the old minidom based vehicleLocations parser with the streaming
+# one in game.nextbus. The recorded feed used by the updatecars tests is
+# blown up to an agency sized feed by repeating its vehicles under new ids.
+#
+#   python benchmarks/nextbus_parser.py [vehicles] [rounds]
+import os
+import re
+import resource
+import sys
+import tempfile
+import time
+from xml.dom import minidom
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from game.nextbus import iter_vehicles
+
+FIXTURE = os.path.join(ROOT, 'game', 'tests', 'management', 'commands',
+                       'test-updatecars.xml')
+ROUTE_LIST = [str(num) for num in range(501, 513)]
+
+
+def minidom_vehicles(source, route_list):
+    """ The parser updatecars used before game.nextbus """
+    tree = minidom.parse(source)
+    for vehicle in tree.getElementsByTagName('vehicle'):
+        if (vehicle.getAttribute('routeTag') in route_list and
+            vehicle.getAttribute('predictable') == u'true'):
+            yield {'number': int(vehicle.getAttribute('id')),
+                   'route': int(vehicle.getAttribute('routeTag')),
+                   'location': [float(vehicle.getAttribute(i))
+                                for i in ('lon', 'lat')]}
+
+
+def build_feed(vehicle_count):
+    with open(FIXTURE) as fixture:
+        lines = fixture.read().splitlines()
+    vehicles = [line for line in lines if '<vehicle ' in line]
+    feed = tempfile.NamedTemporaryFile(suffix='.xml', delete=False)
+    feed.write(lines[0] + '\n')
+    for i in xrange(vehicle_count):
+        line = vehicles[i % len(vehicles)]
+        feed.write(re.sub(r'id="\d+"', 'id="%d"' % (10000 + i), line) + '\n')
+    feed.write('</body>\n')
+    feed.close()
+    return feed.name
+
+
+def measure(parser, path, rounds):
+    """
+    Run the parser in a child process so each one gets its own peak RSS.
+    Returns (seconds per round, peak RSS growth in KB, vehicles yielded).
+    """
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        for i in xrange(rounds):
+            with open(path) as source:
+                count = sum(1 for vehicle in parser(source, ROUTE_LIST))
+        elapsed = (time.time() - start) / rounds
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+        os.write(write_end, '%f %d %d' % (elapsed, peak, count))
+        os._exit(0)
+    os.close(write_end)
+    result = os.read(read_end, 128)
+    os.close(read_end)
+    os.waitpid(pid, 0)
+    elapsed, peak, count = result.split()
+    return float(elapsed), int(peak), int(count)
+
+
+def main(vehicle_count=50000, rounds=3):
+    path = build_feed(vehicle_count)
+    try:
+        size = os.path.getsize(path) / 1024
+        sys.stdout.write('%d vehicles, %d KB feed, %d rounds\n'
+                         % (vehicle_count, size, rounds))
+        for name, parser in (('minidom', minidom_vehicles),
+                             ('iterparse', iter_vehicles)):
+            elapsed, peak, count = measure(parser, path, rounds)
+            sys.stdout.write('%-10s %8.1f ms/round %8d KB peak %6d matched\n'
+                             % (name, elapsed * 1000, peak, count))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -1,14 +1,20 @@
 from django.conf.urls.defaults import *
 
 from rockt.game.views.api.car import *
+from rockt.game.views.api.export import EventExportView
+from rockt.game.views.api.metrics import MetricsView
 from rockt.game.views.api.stop import StopView, StopFindView
-from rockt.game.views.api.user import UserCarListView, UserCarView, UserView
+from rockt.game.views.api.user import (UserCarListView, UserCarView, UserView,
+                                       TokenView)
 
 
 urlpatterns = patterns('api',
     url(r'^car/checkout/$',
         CheckOutView.as_view(),
         name='car-checkout'),
+    url(r'^car/box/$',
+        CarBoxView.as_view(),
+        name='car-box'),
     url(r'^car/(?P<number>[^/]+)/checkin/$',
         CarCheckInView.as_view(),
         name='car-checkin'),
@@ -21,12 +27,21 @@ urlpatterns = patterns('api',
     url(r'^car/(?P<number>[^/]+)/timeline/$',
         CarTimelineView.as_view(),
         name='car-timeline'),
+    url(r'^events/export/$',
+        EventExportView.as_view(),
+        name='event-export'),
+    url(r'^metrics/$',
+        MetricsView.as_view(),
+        name='metrics'),
     url(r'^stop/(?P<number>[^/]+)/$',
         StopView.as_view(),
         name='stop'),
     url(r'^stop/find/(?P<lat>[^/]+)/(?P<lon>[^/]+)/$',
         StopFindView.as_view(),
         name='stop-find'),
+    url(r'^user/token/$',
+        TokenView.as_view(),
+        name='user-token'),
     url(r'^user/$',
         UserView.as_view(),
         name='user'),
@@ -0,0 +1,89 @@
+"""
+Token authentication for the API. Clients trade a username and password
+for a token once, then send "Authorization: Token <key>" on every request,
+which is checked against an in-process cache before the database.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from djangorestframework.authentication import BaseAuthentication
+
+from game import metrics
+from game.models import ApiToken
+from game.models.apitoken import digest
+
+
+class TokenCache(object):
+    """
+    The users of recently used tokens by digest, for API_TOKEN_CACHE_TTL
+    seconds and up to API_TOKEN_CACHE_SIZE of them. Entries never outlive
+    their token, and revoking a token drops it here; other processes keep
+    accepting a revoked token until their entry expires.
+    """
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        token_digest = digest(key)
+        now = time.time()
+        with self.lock:
+            entry = self.entries.pop(token_digest, None)
+            if entry is not None and entry[0] > now:
+                self.entries[token_digest] = entry
+            else:
+                entry = None
+        if entry is not None:
+            metrics.incr('api_token.hits')
+            #Each request gets its own user to hang things off
+            return copy.copy(entry[1])
+
+        metrics.incr('api_token.misses')
+        token = ApiToken.objects.find(key)
+        if token is None:
+            return None
+        user = token.user
+        expires = min(now + settings.API_TOKEN_CACHE_TTL,
+                      time.mktime(token.expires.timetuple()))
+        with self.lock:
+            self.entries[token_digest] = (expires, user)
+            while len(self.entries) > settings.API_TOKEN_CACHE_SIZE:
+                self.entries.popitem(last=False)
+        return copy.copy(user)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(digest(key), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def request_token(request):
+    """ The key in request's Authorization: Token header, or None """
+    auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(auth) == 2 and auth[0].lower() == 'token':
+        return auth[1]
+    return None
+
+
+class TokenAuthentication(BaseAuthentication):
+    """
+    Use a token from ApiToken.objects.issue, sent as
+    "Authorization: Token <key>".
+    """
+    def authenticate(self, request):
+        key = request_token(request)
+        if key is None:
+            return None
+        user = token_cache.get(key)
+        if user is not None and user.is_active:
+            return user
+        return None
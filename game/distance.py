@@ -0,0 +1,66 @@
+"""
+Distances in kilometres between lon/lat points, the order MongoDB uses.
+
+haversine treats the earth as a sphere with the WGS-84 mean radius. Compared
+with geopy's ellipsoidal distance it is within 0.28% (under 90 metres) for
+any two points in Toronto, and within 0.56% anywhere on earth, at a small
+fraction of the cost. DISTANCE_ENGINE picks which one distance() uses.
+"""
+import math
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EARTH_RADIUS = 6371.0088  # WGS-84 mean radius in km
+
+
+def haversine(a, b):
+    """ Great circle distance between two lon/lat points """
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(min(h, 1.0)))
+
+
+def ellipsoidal(a, b):
+    """ geopy's distance on the WGS-84 ellipsoid """
+    from geopy.distance import distance
+    #geopy is lat,lon
+    return distance(a[::-1], b[::-1]).kilometers
+
+
+def pairwise(origins, destinations):
+    """
+    Great circle distances from every point in origins to every point in
+    destinations, as a len(origins) x len(destinations) numpy array.
+    """
+    if numpy is None:
+        raise ImproperlyConfigured('pairwise distances require numpy')
+    origins = numpy.radians(numpy.asarray(origins, dtype=float))
+    destinations = numpy.radians(numpy.asarray(destinations, dtype=float))
+    lon1, lat1 = origins[:, 0, None], origins[:, 1, None]
+    lon2, lat2 = destinations[None, :, 0], destinations[None, :, 1]
+
+    h = (numpy.sin((lat2 - lat1) / 2) ** 2 +
+         numpy.cos(lat1) * numpy.cos(lat2) *
+         numpy.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(h, 1.0)))
+
+
+ENGINES = {'haversine': haversine,
+           'ellipsoidal': ellipsoidal}
+
+
+def distance(a, b):
+    """ Distance between two lon/lat points using DISTANCE_ENGINE """
+    try:
+        engine = ENGINES[settings.DISTANCE_ENGINE]
+    except KeyError:
+        raise ImproperlyConfigured('Unknown DISTANCE_ENGINE %r'
+                                   % settings.DISTANCE_ENGINE)
+    return engine(a, b)
@@ -0,0 +1,129 @@
+"""
+Writes events off the request path. Events are queued in process and a
+background thread inserts them into MongoDB in batches.
+"""
+import atexit
+import os
+import threading
+import time
+from Queue import Queue, Empty, Full
+
+from django.conf import settings
+
+from game import metrics
+
+
+class EventEmitter(object):
+    """
+    Queues event documents and inserts them from a worker thread, at most
+    EVENT_BATCH_SIZE at a time, as soon as they arrive or every
+    EVENT_FLUSH_INTERVAL seconds. The queue holds EVENT_QUEUE_SIZE events;
+    when it's full the caller inserts its event itself rather than losing
+    it. A batch that fails to go in is retried before anything more is
+    taken off the queue. With EVENT_EMITTER_SYNC on every event is inserted
+    as it's emitted, as the tests need. Whatever is still queued is flushed
+    at exit. Each batch inserted is added to the hourly rollups.
+    """
+    def __init__(self):
+        self.queue = None
+        self.worker = None
+        self.pid = None
+        self.lock = threading.Lock()
+        #A batch whose insert failed, tried again on the next flush
+        self.retry = []
+
+    def emit(self, document):
+        if settings.EVENT_EMITTER_SYNC:
+            self.insert([document])
+            return
+        self.start()
+        try:
+            self.queue.put_nowait(document)
+        except Full:
+            metrics.incr('events.overflow')
+            self.insert([document])
+        metrics.gauge('events.queue_depth', self.queue.qsize())
+
+    def start(self):
+        #A forked process doesn't inherit the worker, so it needs its own
+        if self.worker is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.worker is None or self.pid != os.getpid():
+                self.queue = Queue(settings.EVENT_QUEUE_SIZE)
+                self.pid = os.getpid()
+                self.worker = threading.Thread(target=self.run,
+                                               name='event-emitter')
+                self.worker.daemon = True
+                self.worker.start()
+
+    def run(self):
+        queue = self.queue
+        while True:
+            if self.retry:
+                #Leave new events queued until the failed batch goes in, so
+                #what's held here stays bounded by the queue
+                time.sleep(settings.EVENT_FLUSH_INTERVAL)
+                self.write([])
+                continue
+            try:
+                batch = [queue.get(timeout=settings.EVENT_FLUSH_INTERVAL)]
+            except Empty:
+                batch = []
+            batch.extend(self.drain(settings.EVENT_BATCH_SIZE - len(batch)))
+            if batch or self.retry:
+                self.write(batch)
+
+    def drain(self, limit=None):
+        documents = []
+        while limit is None or len(documents) < limit:
+            try:
+                documents.append(self.queue.get_nowait())
+            except Empty:
+                break
+        return documents
+
+    def flush(self):
+        """
+        Insert everything queued now and wait for the worker to finish
+        what it's writing, e.g. before the process exits
+        """
+        if self.queue is None or self.pid != os.getpid():
+            return
+        self.write(self.drain())
+        self.queue.join()
+
+    def write(self, batch):
+        taken = len(batch)
+        with self.lock:
+            batch, self.retry = self.retry + batch, []
+            size = settings.EVENT_BATCH_SIZE
+            for i in xrange(0, len(batch), size):
+                try:
+                    self.insert(batch[i:i + size])
+                except Exception:
+                    metrics.incr('events.failed')
+                    self.retry = batch[i:]
+                    break
+            metrics.gauge('events.queue_depth', self.queue.qsize())
+        for i in xrange(taken):
+            self.queue.task_done()
+
+    def insert(self, documents):
+        from game.models import Event, Rollup
+        from game.util import get_collection
+
+        start = time.time()
+        get_collection(Event).insert(documents)
+        metrics.timing('events.flush', time.time() - start)
+        metrics.incr('events.written', len(documents))
+
+        #The events are stored, so don't let a rollup failure retry them
+        try:
+            Rollup.objects.apply_events(documents)
+        except Exception:
+            metrics.incr('rollups.failed')
+
+
+emitter = EventEmitter()
+atexit.register(emitter.flush)
@@ -0,0 +1,87 @@
+"""
+Streams the event log as newline delimited JSON, one event per line, for
+the exportevents command and the export API.
+"""
+import datetime
+import json
+import zlib
+
+from pymongo.objectid import ObjectId
+
+from game.models import Event
+from game.models.event import (CURSOR_DATE_FORMAT, event_cursor,
+                               parse_timeline_cursor)
+from game.util import get_collection
+
+#Events MongoDB sends back per round trip
+EXPORT_BATCH_SIZE = 1000
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def parse_date(value):
+    """ A YYYY-MM-DD or full cursor style date, ValueError otherwise """
+    for date_format in (CURSOR_DATE_FORMAT, DATE_FORMAT):
+        try:
+            return datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    raise ValueError('Invalid date %r' % value)
+
+
+def find_events(start=None, end=None, events=None, car=None, after=None):
+    """
+    The stored event documents from start up to end, of the types in
+    events, for car, in date order and after the cursor after if given.
+    Documents are read EXPORT_BATCH_SIZE at a time, however many match.
+    """
+    spec = {}
+    if start is not None or end is not None:
+        spec['date'] = {}
+        if start is not None:
+            spec['date']['$gte'] = start
+        if end is not None:
+            spec['date']['$lt'] = end
+    if events:
+        spec['event'] = {'$in': list(events)}
+    if car is not None:
+        spec['data.car'] = car
+    if after is not None:
+        date, event_id = parse_timeline_cursor(after)
+        spec['$or'] = [{'date': {'$gt': date}},
+                       {'date': date, '_id': {'$gt': event_id}}]
+
+    documents = get_collection(Event).find(spec)
+    return documents.sort([('date', 1), ('_id', 1)]).batch_size(
+                                                        EXPORT_BATCH_SIZE)
+
+
+def _default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def ndjson(documents):
+    """
+    Each document as a line of JSON. Every line carries the cursor to pass
+    back as after to resume the export from the next event.
+    """
+    for document in documents:
+        line = {'id': str(document['_id']),
+                'cursor': event_cursor(document['date'], document['_id']),
+                'event': document['event'],
+                'date': document['date'],
+                'data': document.get('data', {})}
+        yield json.dumps(line, default=_default) + '\n'
+
+
+def gzipped(chunks):
+    """ chunks compressed into a gzip stream as they go past """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,79 @@
+import csv
+from contextlib import closing
+from itertools import chain
+
+CHUNK_SIZE = 1 << 16
+
+
+def _iter_chunks(table, first_in=None):
+    # Reading a member of a zip line by line is slow, so read big chunks and
+    # hand them on as lists of lines, newlines kept for the csv module. If
+    # first_in is given, lines whose first field can't be in it are dropped
+    # before the csv module has to parse them, but only in chunks without
+    # quotes that don't start inside a quoted field, where a line might be
+    # part of a field spanning several.
+    tail = ''
+    quoted = False
+    while True:
+        chunk = table.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        data = tail + chunk
+        lines = data.split('\n')
+        tail = lines.pop()
+        if first_in is not None and not quoted and '"' not in data:
+            lines = [line for line in lines
+                     if line.split(',', 1)[0] in first_in]
+        elif (data.count('"') - tail.count('"')) % 2:
+            quoted = not quoted
+        yield [line + '\n' for line in lines]
+    if tail:
+        yield [tail]
+
+
+def read_table(archive, name, first_in=None):
+    """
+    Yield the rows of a GTFS table read straight out of the zip archive,
+    without extracting it. If first_in is given, rows whose first field
+    isn't in it may be skipped.
+    """
+    with closing(archive.open(name)) as table:
+        lines = chain.from_iterable(_iter_chunks(table, first_in))
+        for row in csv.reader(lines):
+            if row:
+                yield row
+
+
+def find_stops(archive, route_list):
+    """
+    Find the stops served by the routes in route_list. Stop data isn't
+    given by route, so the trips on those routes are found first, then the
+    stops those trips call at. Returns a dict of stop number to its
+    description, lon/lat location and route.
+    """
+    route_nums = set(str(route) for route in route_list)
+
+    trip_routes = {}  # Keep track of which route on which trip
+    for trip in read_table(archive, 'trips.txt'):
+        if len(trip) > 3 and trip[3][0:3] in route_nums:
+            # trip[2] is trip_id, trip[3] is route_name
+            trip_routes[trip[2]] = trip[3][0:3]
+
+    stop_id_routes = {}  # Continue to collect route information
+    stop_times = read_table(archive, 'stop_times.txt', first_in=trip_routes)
+    for stop_time in stop_times:
+        # stop_time[0] is trip_id, stop_time[3] is stop_id
+        if len(stop_time) > 3 and stop_time[0] in trip_routes:
+            stop_id_routes[stop_time[3]] = trip_routes[stop_time[0]]
+
+    stops = {}
+    for stop in read_table(archive, 'stops.txt'):
+        # stop_id, stop_code, stop_name, stop_desc, stop_lat, stop_lon
+        if len(stop) > 5 and stop[0] in stop_id_routes:
+            stops[stop[1]] = {
+                #Make the description easy to read
+                'description': stop[2].decode('utf-8', 'replace').title(),
+                #MongoDB indices are lon/lat
+                'location': [float(stop[5]), float(stop[4])],
+                'route': int(stop_id_routes[stop[0]])}
+    return stops
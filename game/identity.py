@@ -0,0 +1,38 @@
+"""
+A request-scoped identity map of user profiles. Every view, resource,
+model method and middleware handling a request gets the same UserProfile
+for a user, loaded once, so a write made through it is seen by the rest of
+the request.
+"""
+import threading
+
+_local = threading.local()
+
+
+def begin():
+    """ Start a request's identity map """
+    _local.profiles = {}
+
+
+def end():
+    """ Throw the request's identity map away """
+    _local.profiles = None
+
+
+def get_profile(user):
+    """
+    user's UserProfile. During a request it's loaded once and shared, with
+    its user and user.get_profile() pointing at the same objects. Outside of
+    one it's whatever user.get_profile() gives.
+    """
+    profiles = getattr(_local, 'profiles', None)
+    if profiles is None:
+        return user.get_profile()
+    profile = profiles.get(user.id)
+    if profile is None:
+        profile = user.get_profile()
+        profiles[user.id] = profile
+        #So profile.user doesn't load another copy of the user
+        profile._user_cache = user
+    user._profile_cache = profile
+    return profile
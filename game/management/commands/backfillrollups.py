@@ -0,0 +1,88 @@
+# This file rebuilds the hourly rollups from the stored events, for history
+# recorded before the rollups existed or after they've gone wrong.
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.models import Car, Event, Rollup
+from game.models.rollup import ROLLUP_FIELDS
+from game.util import get_collection
+
+BATCH_SIZE = 5000
+#Hours that ended less than this long ago may still get events the emitter
+#hasn't written, so they're left to it
+SETTLE_TIME = datetime.timedelta(minutes=1)
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the hourly ridership and revenue rollups from the '
+            'events, up to the last hour that has ended. The rollups are '
+            'built on the side and swapped in, so they can be read and the '
+            'current hour kept up to date while it runs.')
+    option_list = BaseCommand.option_list + (
+        make_option('--since',
+                    dest='since',
+                    default=None,
+                    help='Only rebuild from this day (YYYY-MM-DD) on'),
+    )
+
+    def handle(self, *args, **kwargs):
+        since = kwargs.get('since')
+        if since:
+            try:
+                since = datetime.datetime.strptime(since, '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be a YYYY-MM-DD date')
+        until = (datetime.datetime.now() - SETTLE_TIME).replace(
+                                    minute=0, second=0, microsecond=0)
+        hours = {'$lt': until}
+        if since:
+            hours['$gte'] = since
+
+        #Old rides don't record the route, so use the car's current one
+        routes = dict((car['number'], car.get('route')) for car in
+                      get_collection(Car).find(fields=('number', 'route')))
+
+        rollups = get_collection(Rollup)
+        rebuilt = rollups.database[rollups.name + '_backfill']
+        rebuilt.drop()
+        rebuilt.ensure_index([('kind', 1), ('key', 1), ('hour', 1)],
+                             unique=True)
+
+        #The totals don't depend on the order the events are added in
+        count = 0
+        batch = []
+        for document in get_collection(Event).find({'date': hours}):
+            batch.append(document)
+            if len(batch) == BATCH_SIZE:
+                Rollup.objects.apply_events(batch, routes, rebuilt)
+                count += len(batch)
+                batch = []
+        Rollup.objects.apply_events(batch, routes, rebuilt)
+        count += len(batch)
+
+        self.swap(rollups, rebuilt, hours)
+        rebuilt.drop()
+        self.stdout.write("Backfill complete, %d events rolled up\n" % count)
+
+    def swap(self, rollups, rebuilt, hours):
+        #Overwrite each rollup with its rebuilt totals, then drop the ones
+        #in the hours rebuilt that no event added up to
+        kept = set()
+        for rollup in rebuilt.find():
+            key = (rollup['kind'], rollup['key'], rollup['hour'])
+            kept.add(key)
+            totals = dict((field, rollup.get(field, 0))
+                          for field in ROLLUP_FIELDS)
+            rollups.update({'kind': key[0], 'key': key[1], 'hour': key[2]},
+                           {'$set': totals}, upsert=True)
+
+        stale = [rollup['_id'] for rollup in
+                 rollups.find({'hour': hours},
+                              fields=('kind', 'key', 'hour'))
+                 if (rollup['kind'], rollup['key'], rollup['hour'])
+                    not in kept]
+        for i in xrange(0, len(stale), BATCH_SIZE):
+            rollups.remove({'_id': {'$in': stale[i:i + BATCH_SIZE]}},
+                           safe=True)
@@ -0,0 +1,68 @@
+# This file writes the event log out as newline delimited JSON, for
+# analytics. Events are streamed, so the export runs in constant memory.
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from game.export import find_events, gzipped, ndjson, parse_date
+
+
+class Command(BaseCommand):
+    help = 'Export events as newline delimited JSON'
+    option_list = BaseCommand.option_list + (
+        make_option('--start',
+                    dest='start',
+                    default=None,
+                    help='Only events from this date (YYYY-MM-DD) on'),
+        make_option('--end',
+                    dest='end',
+                    default=None,
+                    help='Only events before this date (YYYY-MM-DD)'),
+        make_option('--event',
+                    action='append',
+                    dest='events',
+                    default=[],
+                    help='Only events of this type, can be repeated'),
+        make_option('--car',
+                    type='int',
+                    dest='car',
+                    default=None,
+                    help='Only events for this car'),
+        make_option('--after',
+                    dest='after',
+                    default=None,
+                    help='Resume after the event with this cursor'),
+        make_option('--gzip',
+                    action='store_true',
+                    dest='gzip',
+                    default=False,
+                    help='Compress the output with gzip'),
+        make_option('--output',
+                    dest='output',
+                    default=None,
+                    help='Write to this file rather than standard output'),
+    )
+
+    def handle(self, *args, **kwargs):
+        try:
+            start, end = [parse_date(kwargs[name]) if kwargs.get(name)
+                          else None for name in ('start', 'end')]
+            documents = find_events(start, end, kwargs.get('events'),
+                                    kwargs.get('car'), kwargs.get('after'))
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = ndjson(documents)
+        if kwargs.get('gzip'):
+            chunks = gzipped(chunks)
+
+        if kwargs.get('output'):
+            output = open(kwargs['output'], 'wb')
+        else:
+            output = self.stdout
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if kwargs.get('output'):
+                output.close()
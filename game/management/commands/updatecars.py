@@ -1,63 +1,79 @@
-from urllib import urlopen
-from xml.dom import minidom
+from optparse import make_option
 
 from django.core.management.base import BaseCommand
-from django.conf import settings
 
-from game.models import Car, FareInfo
+from game.poller import CarPoller
 
 
 class Command(BaseCommand):
     help = 'Update the positions of the streetcars'
+    option_list = BaseCommand.option_list + (
+        make_option('--full',
+                    action='store_true',
+                    dest='full',
+                    default=False,
+                    help='Download every vehicle, not only the ones that '
+                         'moved, and deactivate the cars missing from it'),
+        make_option('--daemon',
+                    action='store_true',
+                    dest='daemon',
+                    default=False,
+                    help='Keep running, polling every NEXTBUS_POLL_INTERVAL '
+                         'seconds and adapting to how busy the feed is'),
+        make_option('--cycles',
+                    type='int',
+                    dest='cycles',
+                    default=None,
+                    help='Stop the daemon after this many polls'),
+    )
 
     def handle(self, *args, **kwargs):
-        route_list = settings.NEXTBUS_ROUTE_LIST
-        cars_updated = self.update_streetcars(route_list)
+        poller = CarPoller()
+        try:
+            if kwargs.get('daemon'):
+                poller.run(cycles=kwargs.get('cycles'),
+                           report=self.report_cycle)
+                return
+            result = poller.poll(full=kwargs.get('full'))
+        finally:
+            poller.close()
+
         self.stdout.write("Update is Complete, %d cars in service\n"
-            % len(cars_updated))
-        self.remove_out_of_service(cars_updated)
-        self.stdout.write("Removal Complete\n")
-
-    def remove_out_of_service(self, cars_updated):
-        all_streetcars = Car.objects.filter(active__exact=True).all()
-
-        to_remove = []
-        for streetcar in all_streetcars:
-            if streetcar.number not in cars_updated:
-                to_remove.append(streetcar.number)
-                self.stdout.write("Removing inactive car {}\n".format(
-                    streetcar.number))
-        if to_remove:
-            for number in to_remove:
-                car = Car.objects.get(number=number)
-                car.active = False
-                car.save()
-
-    def update_streetcars(self, route_list):
-        cars_updated = []
-
-        response = urlopen(settings.NEXTBUS_API_URL)
-        tree = minidom.parse(response)
-
-        for vehicle in tree.getElementsByTagName('vehicle'):
-            if (vehicle.getAttribute('routeTag') in route_list and
-                vehicle.getAttribute('predictable') == u'true'):
-                car_id = vehicle.getAttribute('id')
-                try:
-                    car = Car.objects.get(number=car_id)
-                except Car.DoesNotExist:
-                    car = Car()
-                    car.owner_fares = FareInfo()
-                    car.total_fares = FareInfo()
-
-                car.number = vehicle.getAttribute('id')
-                car.location = [float(vehicle.getAttribute(i)) for i in (
-                                                                'lon',
-                                                                'lat')]
-                car.route = vehicle.getAttribute('routeTag')
-                car.active = True
-                cars_updated.append(int(car.number))
-                self.stdout.write("Car %s in service\n" % car_id)
-                car.save()
-
-        return cars_updated
+            % len(result['cars']))
+        self.stdout.write("%(inserted)d cars inserted, %(moved)d moved, "
+                          "%(rerouted)d rerouted, %(refreshed)d refreshed, "
+                          "%(skipped)d writes skipped\n" % result)
+        if result['full']:
+            self.stdout.write("Removal Complete, %d cars deactivated\n"
+                % result['deactivated'])
+        self.report_routes(result)
+
+    def report_cycle(self, result, interval):
+        if isinstance(result, IOError):
+            self.stdout.write("Feed unavailable (%s), next poll in %ds\n"
+                % (result, interval))
+            return
+        if isinstance(result, Exception):
+            self.stdout.write("Poll failed (%s: %s), next poll in %ds\n"
+                % (type(result).__name__, result, interval))
+            return
+        self.stdout.write(
+            "%s poll: %d cars, %d inserted, %d moved, %d rerouted, "
+            "%d writes skipped, "
+            "%d deactivated; fetch %.0fms parse %.0fms write %.0fms; "
+            "next poll in %ds\n"
+            % ('Full' if result['full'] else 'Incremental',
+               len(result['cars']), result['inserted'], result['moved'],
+               result['rerouted'], result['skipped'], result['deactivated'],
+               result['fetch'] * 1000, result['parse'] * 1000,
+               result['write'] * 1000, interval))
+        self.report_routes(result)
+
+    def report_routes(self, result):
+        if result['routes']:
+            self.stdout.write("Route fetch times: %s\n" % ', '.join(
+                '%s %.0fms' % (route, elapsed * 1000)
+                for route, elapsed in sorted(result['routes'].items())))
+        if result['failed']:
+            self.stdout.write("Routes failed: %s\n"
+                % ', '.join(result['failed']))
@@ -1,92 +1,69 @@
-# This file imports from GTFS datasets. The process is rather roundabout
-# due to lack of stop data by route. The entire process is very
-# inefficient, but it's destined not to run very often
-import itertools
+# This file imports from GTFS datasets. The archive is downloaded to an
+# anonymous temporary file and its tables are read straight out of it.
+import datetime
+import hashlib
 import tempfile
+from contextlib import closing
+from optparse import make_option
 from urllib import urlopen
 from zipfile import ZipFile
-from shutil import rmtree
 
 from django.core.management.base import BaseCommand
 from django.conf import settings
 
-from game.models import Stop
+from game.gtfs import find_stops
+from game.models import Stop, SyncState
+from game.spatial import stops_generation
+
+CHUNK_SIZE = 1 << 16
 
 
 class Command(BaseCommand):
     help = 'Update the location data for the stops'
+    option_list = BaseCommand.option_list + (
+        make_option('--force',
+                    action='store_true',
+                    dest='force',
+                    default=False,
+                    help='Import even if the archive is the same as the '
+                         'last one imported'),
+    )
 
     def handle(self, *args, **kwargs):
         self.stdout.write("Downloading stops\n")
+        state = SyncState.objects.get_state('gtfs')
 
-        tmpdir = tempfile.mkdtemp()
-        path_to_gvfs = ''
-        try:
-            self.retrieve_data(tmpdir)
+        with closing(tempfile.TemporaryFile()) as datafile:
+            digest = self.retrieve_data(datafile)
             self.stdout.write("Download complete\n")
-            self.update_stops(tmpdir)
-        finally:
-            rmtree(tmpdir)
-
-    def retrieve_data(self, tmpdir):
-        gtfs_url = settings.GTFS_URL
-        datafilename = tmpdir + '/data.zip'
-        datafile = open(datafilename, 'w')
-        request = urlopen(gtfs_url)
-        for line in request:
-            datafile.write(line)
-        datafile.close()
-
-        archive = ZipFile(datafilename)
-        archive.extractall(tmpdir)
-        archive.close()
+            if digest == state.cursor and not kwargs.get('force'):
+                self.stdout.write("Archive unchanged since the last import, "
+                                  "skipping\n")
+                return
+            with closing(ZipFile(datafile)) as archive:
+                self.update_stops(archive)
 
-    def update_stops(self, path_to_gtfs):
-        route_nums = []
-        for i in settings.NEXTBUS_ROUTE_LIST:
-            route_nums.append(str(i))
+        state.cursor = digest
+        state.full_sync = datetime.datetime.now()
+        state.save()
+        stops_generation.bump()
 
-        trip_set = set()  # We use a set to avoid duplicates
-        trip_routes = {}  # Keep track of which route on which trip
-        with open(path_to_gtfs + '/trips.txt') as trips:
-            for trip in trips:
-                trip = trip.split(',')
-                if trip[3][0:3] in route_nums:  # trip[3] is route_name
-                    trip_set.add(trip[2])  # trip[2] is trip_id
-                    # store which route for which trip
-                    trip_routes[trip[2]] = trip[3][0:3]
-
-        stop_id_set = set()
-        stop_id_routes = {}  # Continue to collect route information
-        with open(path_to_gtfs + '/stop_times.txt') as stop_times:
-            for stop_time in stop_times:
-                stop_time = stop_time.split(',')
-                if stop_time[0] in trip_set:  # stop_time[0] is trip_id
-                    stop_id_set.add(stop_time[3])  # stop_time[3] is stop_id
-                    stop_id_routes[stop_time[3]] = trip_routes[stop_time[0]]
-
-        stop_set = set()
-        with open(path_to_gtfs + '/stops.txt') as stops:
-            for stop in stops:
-                stop = stop.split(',')
-                if stop[0] in stop_id_set:
-                    arr = itertools.chain(stop[1:3],
-                                          stop[4:6],
-                                          [stop_id_routes[stop[0]]])
-                    stop_set.add(tuple(arr))
-
-        count = 0
-        Stop.objects.all().delete()
-        for stop in stop_set:
-            new_stop = Stop()
-            new_stop.number = stop[0]
-            #Make the description easy to read
-            new_stop.description = stop[1].title()
-            #MongoDB indices are lon/lat
-            new_stop.location = (float(stop[3]), float(stop[2]))
-            new_stop.route = int(stop[4])
-            new_stop.save()
-            count += 1
-            self.stdout.write(new_stop.description + " imported.\n")
+    def retrieve_data(self, datafile):
+        """ Download the archive into datafile, returning its SHA-1 """
+        digest = hashlib.sha1()
+        request = urlopen(settings.GTFS_URL)
+        try:
+            for chunk in iter(lambda: request.read(CHUNK_SIZE), ''):
+                digest.update(chunk)
+                datafile.write(chunk)
+        finally:
+            request.close()
+        datafile.seek(0)
+        return digest.hexdigest()
 
-        self.stdout.write("importation complete. %d stops imported\n" % count)
+    def update_stops(self, archive):
+        stops = find_stops(archive, settings.NEXTBUS_ROUTE_LIST)
+        counts = Stop.objects.apply_import(stops)
+        self.stdout.write("importation complete. %(added)d stops added, "
+                          "%(changed)d changed, %(removed)d removed, "
+                          "%(unchanged)d unchanged\n" % counts)
@@ -0,0 +1,44 @@
+"""
+In-process counters, gauges and timers, shown to staff through the metrics
+API.
+"""
+import threading
+from collections import defaultdict
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_gauges = {}
+#name: [calls, total seconds]
+_timers = defaultdict(lambda: [0, 0.0])
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def timing(name, seconds):
+    with _lock:
+        timer = _timers[name]
+        timer[0] += 1
+        timer[1] += seconds
+
+
+def snapshot():
+    with _lock:
+        return {'counters': dict(_counters),
+                'gauges': dict(_gauges),
+                'timers': dict((name, {'calls': calls, 'seconds': seconds})
+                               for name, (calls, seconds) in _timers.items())}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timers.clear()
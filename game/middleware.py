@@ -1,3 +1,20 @@
+from game import identity
+from game.identity import get_profile
+
+
+class ProfileIdentityMiddleware(object):
+    """ Shares one UserProfile per user across everything in a request """
+    def process_request(self, request):
+        identity.begin()
+
+    def process_response(self, request, response):
+        identity.end()
+        return response
+
+    def process_exception(self, request, exception):
+        identity.end()
+
+
 class UsernameBalanceMiddleware(object):
     def process_template_response(self, request, response):
         user = request.user
@@ -5,5 +22,5 @@ class UsernameBalanceMiddleware(object):
             if response.context_data is None:
                 response.context_data = {}
             response.context_data['username'] = user.username
-            response.context_data['balance'] = user.get_profile().balance
+            response.context_data['balance'] = get_profile(user).balance
         return response
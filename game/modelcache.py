@@ -0,0 +1,144 @@
+"""
+Read-through caches for the lookups by number almost every API call starts
+with. Each process keeps up to MODEL_CACHE_SIZE instances of each model for
+MODEL_CACHE_TTL seconds, in front of Django's cache when MODEL_CACHE_SHARED
+is on. Saving or deleting an instance, or one of the bulk writes, drops it
+from this process's cache and the shared one; other processes may see the
+old instance until it expires.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from game import metrics
+
+#The models cached, by name, and the field they're looked up by
+CACHED_MODELS = {'Car': 'number', 'Stop': 'number'}
+
+
+class ModelCache(object):
+    def __init__(self, model, field):
+        self.model = model
+        self.field = field
+        self.name = model._meta.object_name
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, value):
+        """
+        The instance whose field is value, raising DoesNotExist like a
+        query would. Callers get their own copy to change.
+        """
+        now = time.time()
+        key = unicode(value)
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] > now:
+                self.entries[key] = entry
+            else:
+                entry = None
+
+        if entry is not None:
+            instance = entry[1]
+            metrics.incr('model_cache.%s.hits' % self.name)
+        else:
+            metrics.incr('model_cache.%s.misses' % self.name)
+            instance = self.load(key)
+            with self.lock:
+                self.entries[key] = (now + settings.MODEL_CACHE_TTL, instance)
+                while len(self.entries) > settings.MODEL_CACHE_SIZE:
+                    self.entries.popitem(last=False)
+
+        instance = copy.deepcopy(instance)
+        metrics.timing('model_cache.%s.lookup' % self.name, time.time() - now)
+        return instance
+
+    def load(self, key):
+        shared_key = None
+        if settings.MODEL_CACHE_SHARED:
+            shared_key = self.shared_key(key)
+            instance = cache.get(shared_key)
+            if instance is not None:
+                return instance
+        instance = self.model.objects.get(**{self.field: key})
+        if shared_key is not None:
+            cache.set(shared_key, instance, settings.MODEL_CACHE_TTL)
+        return instance
+
+    def generation_key(self):
+        return 'game.model.%s.generation' % self.name
+
+    def shared_key(self, key):
+        #Bumping the generation drops every shared entry at once
+        generation = cache.get(self.generation_key(), 0)
+        return 'game.model.%s.%s.%s' % (self.name, generation, key)
+
+    def invalidate(self, values):
+        keys = [unicode(value) for value in values]
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+        if settings.MODEL_CACHE_SHARED and keys:
+            cache.delete_many([self.shared_key(key) for key in keys])
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        if settings.MODEL_CACHE_SHARED:
+            cache.set(self.generation_key(),
+                      cache.get(self.generation_key(), 0) + 1)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(model):
+    """ model's ModelCache, or None if it isn't cached """
+    name = model._meta.object_name
+    if name not in CACHED_MODELS:
+        return None
+    if name not in _caches:
+        with _caches_lock:
+            if name not in _caches:
+                _caches[name] = ModelCache(model, CACHED_MODELS[name])
+    return _caches[name]
+
+
+def lookup(model, value):
+    """
+    The instance of a cached model looked up by value through its cache,
+    or straight from the database if MODEL_CACHE_SIZE is 0
+    """
+    model_cache = get_cache(model)
+    if not settings.MODEL_CACHE_SIZE:
+        return model.objects.get(**{model_cache.field: value})
+    return model_cache.get(value)
+
+
+def invalidate(model, *values):
+    """ Drop the instances of model looked up by values """
+    model_cache = get_cache(model)
+    if model_cache is not None:
+        model_cache.invalidate(values)
+
+
+def clear(model):
+    """ Drop every cached instance of model """
+    model_cache = get_cache(model)
+    if model_cache is not None:
+        model_cache.clear()
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def instance_changed(sender, instance, **kwargs):
+    field = CACHED_MODELS.get(sender._meta.object_name)
+    if field is not None:
+        invalidate(sender, getattr(instance, field))
@@ -1,4 +1,8 @@
 from game.models.userprofile import UserProfile
 from game.models.stop import Stop
 from game.models.car import Car, FareInfo
-from game.models.event import Event
+from game.models.event import Event, timeline_cursor
+from game.models.syncstate import SyncState
+from game.models.trajectory import Trajectory
+from game.models.rollup import Rollup
+from game.models.apitoken import ApiToken
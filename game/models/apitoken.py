@@ -0,0 +1,55 @@
+import datetime
+import hashlib
+import os
+
+from django.db import models
+from django.conf import settings
+from django.contrib.auth.models import User
+
+
+def digest(key):
+    """ Tokens are stored by their SHA-1, never as issued """
+    return hashlib.sha1(key).hexdigest()
+
+
+class ApiTokenManager(models.Manager):
+    def issue(self, user):
+        """
+        A new token for user, valid for API_TOKEN_LIFETIME seconds. Returns
+        the key to hand to the client and the stored ApiToken.
+        """
+        key = os.urandom(20).encode('hex')
+        expires = (datetime.datetime.now() +
+                   datetime.timedelta(seconds=settings.API_TOKEN_LIFETIME))
+        token = self.create(digest=digest(key), user=user, expires=expires)
+        return key, token
+
+    def find(self, key):
+        """ The unexpired token for key, or None """
+        try:
+            token = self.get(digest=digest(key))
+        except ApiToken.DoesNotExist:
+            return None
+        if token.expires <= datetime.datetime.now():
+            return None
+        return token
+
+    def revoke(self, key):
+        """ Delete the token for key, returning whether there was one """
+        tokens = self.filter(digest=digest(key))
+        found = tokens.exists()
+        tokens.delete()
+        return found
+
+
+#A key the API accepts in place of a username and password
+class ApiToken(models.Model):
+    digest = models.CharField(max_length=40, unique=True)
+    user = models.ForeignKey(User)
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField()
+
+    objects = ApiTokenManager()
+
+    class Meta:
+        app_label = "game"
@@ -1,5 +1,8 @@
+import datetime
+
 from django.db import models
 from pymongo import GEO2D
+from pymongo.objectid import ObjectId
 from djangotoolbox.fields import ListField, EmbeddedModelField
 from django_mongodb_engine.contrib import MongoDBManager
 from django.db.models.signals import pre_save
@@ -10,7 +13,12 @@ from django.core.urlresolvers import get_callable
 from userprofile import UserProfile
 from event import Event
 from game.rules import get_rule
+from game.util import get_collection
+from game import modelcache
+from game.distance import haversine
+from game.identity import get_profile
 from location import LocationClass
+from trajectory import Trajectory
 
 
 @receiver(pre_save)
@@ -34,11 +42,160 @@ class FareInfo(models.Model):
     revenue = models.IntegerField(default=0)
 
 
+def _fare_defaults():
+    #A new FareInfo as it's stored, the same defaults the ORM would give it
+    return dict((field.column, field.get_default())
+                for field in FareInfo._meta.fields
+                if not field.primary_key)
+
+
 class CarLocatorManager(MongoDBManager):
     def find_nearby(self, stop):
         return self.raw_query({'location': {'$near': stop.location},
                                 'route': stop.route, 'active': True})
 
+    def find_in_bbox(self, bbox):
+        """
+        The number, route and location of each active car in bbox (min lon,
+        min lat, max lon, max lat), as documents
+        """
+        box = [bbox[:2], bbox[2:]]
+        return get_collection(self.model).find(
+                            {'location': {'$within': {'$box': box}},
+                             'active': True},
+                            fields=('number', 'route', 'location'))
+
+    def update_positions(self, vehicles):
+        """
+        Write the positions from one poll of the feed in bulk. The stored
+        cars are read with a single query and new cars go in as one batch
+        insert. A stored car is only rewritten if it moved at least
+        CAR_MOVE_THRESHOLD metres, changed route, came back into service or
+        hasn't been written for CAR_MAX_STALENESS seconds. Every write is
+        acknowledged, so one that fails fails the poll. Returns the number
+        of cars inserted, moved, rerouted without moving, refreshed for
+        another reason and skipped, and the numbers of the cars inserted or
+        rewritten under 'written'.
+        """
+        collection = get_collection(self.model)
+        vehicles = dict((vehicle['number'], vehicle) for vehicle in vehicles)
+        counts = {'inserted': 0, 'moved': 0, 'rerouted': 0, 'refreshed': 0,
+                  'skipped': 0}
+        now = datetime.datetime.now()
+        threshold = settings.CAR_MOVE_THRESHOLD
+        stale = now - datetime.timedelta(seconds=settings.CAR_MAX_STALENESS)
+
+        stored = collection.find({'number': {'$in': vehicles.keys()}},
+                                 fields=('number', 'route', 'active',
+                                         'location', 'updated'))
+        seen = set()
+        written = []
+        for document in stored:
+            vehicle = vehicles[document['number']]
+            seen.add(vehicle['number'])
+
+            location = document.get('location')
+            if (not location or
+                haversine(location, vehicle['location']) * 1000 >= threshold):
+                counts['moved'] += 1
+            elif document.get('route') != vehicle['route']:
+                counts['rerouted'] += 1
+            elif (not document.get('active') or
+                  document.get('updated') is None or
+                  document['updated'] < stale):
+                counts['refreshed'] += 1
+            else:
+                counts['skipped'] += 1
+                continue
+
+            written.append(vehicle['number'])
+            collection.update({'_id': document['_id']},
+                              {'$set': {'route': vehicle['route'],
+                                        'location': vehicle['location'],
+                                        'active': True,
+                                        'updated': now}},
+                              safe=True)
+
+        new_cars = [self._new_car_document(vehicle, now)
+                    for number, vehicle in vehicles.items()
+                    if number not in seen]
+        if new_cars:
+            collection.insert(new_cars, safe=True)
+        counts['inserted'] = len(new_cars)
+        modelcache.invalidate(self.model, *written)
+        counts['written'] = written + [car['number'] for car in new_cars]
+        return counts
+
+    def deactivate_missing(self, numbers, routes=None):
+        """
+        Mark every active car whose number isn't in numbers as out of
+        service with one update, only looking at cars on routes if given.
+        Returns how many cars were deactivated.
+        """
+        spec = {'active': True, 'number': {'$nin': list(numbers)}}
+        if routes is not None:
+            spec['route'] = {'$in': list(routes)}
+        result = get_collection(self.model).update(
+                            spec, {'$set': {'active': False}},
+                            multi=True, safe=True)
+        if result['n']:
+            modelcache.clear(self.model)
+        return result['n']
+
+    def record_fare(self, car, fare):
+        """
+        Count a rider paying fare on car in its owner_fares and total_fares
+        with one atomic $inc, so concurrent rides are never lost, and bring
+        car's counters up to date.
+        """
+        increments = {}
+        for field in ('owner_fares', 'total_fares'):
+            increments[field + '.riders'] = 1
+            increments[field + '.revenue'] = fare
+        document = get_collection(self.model).find_and_modify(
+                            {'_id': ObjectId(car.pk)},
+                            {'$inc': increments},
+                            fields={'owner_fares': 1, 'total_fares': 1},
+                            new=True)
+        for field in ('owner_fares', 'total_fares'):
+            setattr(car, field, FareInfo(riders=document[field]['riders'],
+                                         revenue=document[field]['revenue']))
+        modelcache.invalidate(self.model, car.number)
+
+    def change_owner(self, car, profile):
+        """
+        Give car to profile, or nobody if None, and start its owner_fares
+        over, but only if it still has the owner it was loaded with, so of
+        concurrent sales only one goes through. Returns whether it did.
+        Only those two fields are written, so rides counted in the
+        meantime aren't overwritten.
+        """
+        owner_id = ObjectId(profile.pk) if profile is not None else None
+        old_id = ObjectId(car.owner_id) if car.owner_id is not None else None
+        document = get_collection(self.model).find_and_modify(
+                            {'_id': ObjectId(car.pk), 'owner_id': old_id},
+                            {'$set': {'owner_id': owner_id,
+                                      'owner_fares': _fare_defaults()}},
+                            fields={'_id': 1})
+        modelcache.invalidate(self.model, car.number)
+        if document is None:
+            return False
+        car.owner = profile
+        car.owner_fares = FareInfo()
+        return True
+
+    def _new_car_document(self, vehicle, updated):
+        #Same defaults add_fareinfo gives cars saved through the ORM
+        fares = _fare_defaults()
+        return {'number': vehicle['number'],
+                'route': vehicle['route'],
+                'location': vehicle['location'],
+                'active': True,
+                'updated': updated,
+                'owner_id': None,
+                'owner_fares': fares,
+                'total_fares': dict(fares)}
+
 
 class Car(models.Model, LocationClass):
     #Location information fields
@@ -46,6 +203,8 @@ class Car(models.Model, LocationClass):
     route = models.IntegerField(null=True)
     active = models.BooleanField(default=False)
     location = ListField()
+    #When the poller last wrote the location
+    updated = models.DateTimeField(null=True)
 
     #Financial information fields
     owner = models.ForeignKey('game.UserProfile', null=True)
@@ -57,59 +216,61 @@ class Car(models.Model, LocationClass):
     def sell_to(self, user):
         if not get_rule('RULE_CAN_BUY_CAR', user, self):
             raise self.NotAllowedException
-        old_user = self.owner
         price = get_rule('RULE_GET_STREETCAR_PRICE', user, self)
-        profile = user.get_profile()
-        if profile.balance < price:
+        profile = get_profile(user)
+        if not UserProfile.objects.debit(profile, price):
             raise UserProfile.InsufficientFundsException
-        self.owner = profile
-        self.owner_fares = FareInfo()
-        self.save()
-        profile.balance -= price
+        if not Car.objects.change_owner(self, profile):
+            #Someone else bought or sold it first
+            UserProfile.objects.credit(profile, price)
+            raise self.NotAllowedException
 
         Event.objects.add_car_bought(self, user, price, self._get_owner_user())
-        profile.save()
 
     def buy_back(self, user):
-        profile = user.get_profile()
+        profile = get_profile(user)
         if not self.owner == profile:
             raise self.NotAllowedException
         price = get_rule('RULE_GET_STREETCAR_PRICE', self.owner, self)
-        self.owner = None
-        self.owner_fares = FareInfo()
-        self.save()
+        if not Car.objects.change_owner(self, None):
+            raise self.NotAllowedException
 
-        profile.balance += price
+        UserProfile.objects.credit(profile, price)
         Event.objects.add_car_sold(self, user, price)
-        profile.save()
 
     def ride(self, user, on, off):
-        profile = user.get_profile()
+        profile = get_profile(user)
         #You don't have to pay for your own streetcars
         insufficient_funds = False
         fare_paid = get_rule('RULE_FIND_FARE', user, self, on, off)
-        if fare_paid > profile.balance:
+        if fare_paid and not UserProfile.objects.debit(profile, fare_paid):
             fare_paid = 0
             insufficient_funds = True
 
-        for fare_info in (self.owner_fares, self.total_fares):
-            fare_info.riders += 1
-            fare_info.revenue += fare_paid
-        self.save()
+        Car.objects.record_fare(self, fare_paid)
 
         Event.objects.add_car_ride(user, self._get_owner_user(), self,
                                    on, off, fare_paid)
 
         if (insufficient_funds):
             raise UserProfile.InsufficientFundsException
-        profile.balance -= fare_paid
-        profile.save()
-        if self.owner:
-            self.owner.balance += fare_paid
-            self.owner.save()
+        if self.owner and fare_paid:
+            UserProfile.objects.credit(self.owner, fare_paid)
 
         return fare_paid
 
+    def trajectory(self, start, end=None):
+        """
+        Where the car was from start to end (default now), as a list of
+        (datetime, lon, lat) fixes, oldest first. Only the last
+        CAR_TRAJECTORY_SIZE polls are kept.
+        """
+        try:
+            trajectory = Trajectory.objects.get(number=self.number)
+        except Trajectory.DoesNotExist:
+            return []
+        return trajectory.between(start, end)
+
     def _get_owner_user(self):
         if self.owner:
             return self.owner.user
@@ -1,33 +1,92 @@
+import datetime
+
 from django.db import models
 from djangotoolbox.fields import DictField
 from django_mongodb_engine.contrib import MongoDBManager
-from pymongo.objectid import InvalidId
+from pymongo.objectid import ObjectId, InvalidId
 from django.contrib.auth.models import User
 
+from game.emitter import emitter
+
+#Timeline events have their users looked up this many events at a time
+TIMELINE_PAGE_SIZE = 200
+#Users kept between pages of a timeline, before starting over
+TIMELINE_USER_CACHE_SIZE = 1000
+USER_FIELDS = ('old_user', 'user', 'rider')
+CURSOR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def _is_object_id(value):
+    try:
+        ObjectId(value)
+    except (InvalidId, TypeError):
+        return False
+    return True
+
+
+def event_cursor(date, event_id):
+    """ The cursor for the events that come after the one at date """
+    return '%s_%s' % (date.strftime(CURSOR_DATE_FORMAT), event_id)
+
+
+def timeline_cursor(event):
+    """ The cursor for the timeline events that come after event """
+    return event_cursor(event.date, event.id)
+
+
+def parse_timeline_cursor(cursor):
+    """ The date and id in a timeline cursor, ValueError if it isn't one """
+    date, _, event_id = cursor.partition('_')
+    date = datetime.datetime.strptime(date, CURSOR_DATE_FORMAT)
+    try:
+        return date, ObjectId(event_id)
+    except (InvalidId, TypeError):
+        raise ValueError('Invalid event id in cursor %r' % cursor)
+
 
 class EventManager(MongoDBManager):
+    def emit(self, event, data):
+        """
+        Record an event through the emitter, which inserts it in the
+        background. The id and date are set here, so the returned Event is
+        the same one that will be stored.
+        """
+        #MongoDB keeps dates to the millisecond
+        now = datetime.datetime.now()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        event = self.model(id=unicode(ObjectId()), event=event, data=data,
+                           date=now)
+        emitter.emit({'_id': ObjectId(event.id),
+                      'event': event.event,
+                      'data': event.data,
+                      'date': event.date})
+        return event
+
     def add_car_bought(self, car, user, price, old_user=None):
         event = 'car_bought'
 
         data = {'car': car.number,
+                'route': car.route,
                 'user': user.id,
                 'price': price}
         if old_user:
             data['old_user'] = old_user.id
-        return self.create(event=event, data=data)
+        return self.emit(event, data)
 
     def add_car_sold(self, car, user, price):
         event = 'car_sold'
         data = {'car': car.number,
+                'route': car.route,
                 'user': user.id,
                 'price': price}
-        return self.create(event=event, data=data)
+        return self.emit(event, data)
 
     def add_car_ride(self, rider, owner, car, on, off, fare):
         ##TODO: Make more robust framework for measuring distances
         traveled = on.distance_to(off)
         event = 'car_ride'
         data = {'car': car.number,
+                'route': car.route,
                 'rider': rider.id,
                 'on': {'number': on.number,
                       'location': on.location},
@@ -37,20 +96,57 @@ class EventManager(MongoDBManager):
                 'fare': fare}
         if owner:
             data['owner'] = owner.id
-        return self.create(event=event, data=data)
+        return self.emit(event, data)
 
-    def get_car_timeline(self, car):
-        user_fields = ('old_user', 'user', 'rider')
-        for event in self.raw_query({'data.car': car.number}):
-            for field in user_fields:
-                if field in event.data:
-                    try:
-                        event.data[field] = User.objects.get(
-                            id=event.data[field])
-                    except (User.DoesNotExist, InvalidId):
-                        event.data[field] = None
+    def get_car_timeline(self, car, after=None, limit=None):
+        """
+        The events for car in date order, with the user ids in their data
+        replaced by the users, or None for users that don't exist. after is
+        a cursor from timeline_cursor to start from the event after, limit
+        the most events to return. Events are read TIMELINE_PAGE_SIZE at a
+        time and each page's users are fetched with one query, reusing the
+        users earlier pages fetched.
+        """
+        spec = {'data.car': car.number}
+        if after is not None:
+            date, event_id = parse_timeline_cursor(after)
+            spec['$or'] = [{'date': {'$gt': date}},
+                           {'date': date, '_id': {'$gt': event_id}}]
+        events = self.raw_query(spec).order_by('date', 'id')
+        if limit is not None:
+            events = events[:limit]
+
+        users = {}
+        page = []
+        for event in events:
+            page.append(event)
+            if len(page) == TIMELINE_PAGE_SIZE:
+                for event in self._resolve_users(page, users):
+                    yield event
+                page = []
+        for event in self._resolve_users(page, users):
             yield event
 
+    def _resolve_users(self, events, users):
+        if len(users) > TIMELINE_USER_CACHE_SIZE:
+            users.clear()
+        missing = set(event.data[field] for event in events
+                      for field in USER_FIELDS
+                      if field in event.data and
+                         event.data[field] not in users)
+        ids = [user_id for user_id in missing if _is_object_id(user_id)]
+        if ids:
+            for user in User.objects.filter(id__in=ids):
+                users[user.id] = user
+        for user_id in missing:
+            users.setdefault(user_id, None)
+
+        for event in events:
+            for field in USER_FIELDS:
+                if field in event.data:
+                    event.data[field] = users[event.data[field]]
+        return events
+
 
 class Event(models.Model):
     event = models.TextField()
@@ -64,4 +160,8 @@ class Event(models.Model):
         app_label = "game"
 
     class MongoMeta:
-        indexes = [{'fields': [('data.car', 1)], 'sparse': True}]
+        #Serve both the filter and the sort of a timeline page, and the
+        #sort of an export of every car
+        indexes = [{'fields': [('data.car', 1), ('date', 1), ('_id', 1)],
+                    'sparse': True},
+                   {'fields': [('date', 1), ('_id', 1)]}]
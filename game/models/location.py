@@ -1,9 +1,9 @@
 from django.db import models
-from geopy.distance import distance
+
+from game.distance import distance
 
 
 class LocationClass:
     def distance_to(self, model):
-        #geopy is lat,lon, mongo is lon,lat
-        return distance(*(stop.location[::-1]
-                         for stop in (self, model))).kilometers
+        """ Kilometres to another located model, using DISTANCE_ENGINE """
+        return distance(self.location, model.location)
@@ -0,0 +1,117 @@
+import datetime
+from collections import defaultdict
+
+from django.db import models
+from django_mongodb_engine.contrib import MongoDBManager
+
+from game.util import get_collection
+
+#What's counted in each rollup
+ROLLUP_FIELDS = ('riders', 'revenue', 'traveled', 'purchases', 'sales')
+ROLLUP_KINDS = ('car', 'route', 'owner')
+
+
+def _hour(date):
+    return date.replace(minute=0, second=0, microsecond=0)
+
+
+def _increments(event, data):
+    if event == 'car_ride':
+        return {'riders': 1, 'revenue': data.get('fare', 0),
+                'traveled': data.get('traveled', 0)}
+    if event == 'car_bought':
+        return {'purchases': 1}
+    if event == 'car_sold':
+        return {'sales': 1}
+    return {}
+
+
+class RollupManager(MongoDBManager):
+    def apply_events(self, documents, routes=None, collection=None):
+        """
+        Add event documents, as stored, to the hourly rollups of their car,
+        route and owner, with one upserted $inc per rollup touched. The
+        owner of a ride is the car's owner, of a purchase or sale the user
+        buying or selling. routes maps car numbers to routes for events
+        recorded before they carried the route. The rollups are written to
+        collection if given, instead of the model's.
+        """
+        totals = defaultdict(lambda: defaultdict(int))
+        for document in documents:
+            data = document['data']
+            increments = _increments(document['event'], data)
+            if not increments:
+                continue
+            if document['event'] == 'car_ride':
+                owner = data.get('owner')
+            else:
+                owner = data.get('user')
+            route = data.get('route')
+            if route is None and routes is not None:
+                route = routes.get(data['car'])
+
+            hour = _hour(document['date'])
+            for kind, key in (('car', data['car']), ('route', route),
+                              ('owner', owner)):
+                if key is None:
+                    continue
+                rollup = totals[(kind, unicode(key), hour)]
+                for field, amount in increments.items():
+                    rollup[field] += amount
+
+        if collection is None:
+            collection = get_collection(self.model)
+        for (kind, key, hour), increments in totals.items():
+            collection.update({'kind': kind, 'key': key, 'hour': hour},
+                              {'$inc': dict(increments)}, upsert=True)
+        return len(totals)
+
+    def series(self, kind, key, start, end=None):
+        """ The hourly rollups for key from start to end (default now) """
+        if end is None:
+            end = datetime.datetime.now()
+        return self.filter(kind=kind, key=unicode(key),
+                           hour__gte=_hour(start),
+                           hour__lte=end).order_by('hour')
+
+    def totals(self, kind, keys, start, end=None):
+        """
+        The rollups of each of keys added up from start to end (default
+        now), as a dict of key to a dict of ROLLUP_FIELDS. Keys without any
+        rollups have every field 0.
+        """
+        if end is None:
+            end = datetime.datetime.now()
+        keys = dict((unicode(key), key) for key in keys)
+        totals = dict((key, dict.fromkeys(ROLLUP_FIELDS, 0))
+                      for key in keys.values())
+        rollups = get_collection(self.model).find(
+                            {'kind': kind, 'key': {'$in': keys.keys()},
+                             'hour': {'$gte': _hour(start), '$lte': end}},
+                            fields=('key',) + ROLLUP_FIELDS)
+        for rollup in rollups:
+            total = totals[keys[rollup['key']]]
+            for field in ROLLUP_FIELDS:
+                total[field] += rollup.get(field, 0)
+        return totals
+
+
+class Rollup(models.Model):
+    """ What happened to one car, route or owner in one hour """
+    kind = models.CharField(max_length=10)
+    key = models.CharField(max_length=40)
+    hour = models.DateTimeField()
+    riders = models.IntegerField(default=0)
+    revenue = models.IntegerField(default=0)
+    traveled = models.FloatField(default=0)
+    purchases = models.IntegerField(default=0)
+    sales = models.IntegerField(default=0)
+
+    objects = RollupManager()
+
+    class Meta:
+        app_label = "game"
+
+    class MongoMeta:
+        indexes = [{'fields': [('kind', 1), ('key', 1), ('hour', 1)],
+                    'unique': True}]
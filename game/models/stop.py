@@ -4,12 +4,57 @@ from djangotoolbox.fields import ListField
 from pymongo import GEO2D
 
 from location import LocationClass
+from game.util import get_collection
+from game import modelcache
+
+IMPORT_BATCH_SIZE = 500
+IMPORT_FIELDS = ('route', 'description', 'location')
+
+
+def _batches(items, size=IMPORT_BATCH_SIZE):
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
 
 
 class StopLocatorManager(MongoDBManager):
     def find_nearby(self, location):
         return self.raw_query({'location': {'$near': location}})
 
+    def apply_import(self, stops):
+        """
+        Bring the stored stops in line with stops, a dict of stop number to
+        its route, description and location, without emptying the
+        collection first. Only the differences are written: new stops are
+        inserted and removed ones deleted in batches, changed ones updated.
+        Returns the number of stops added, changed, removed and unchanged.
+        """
+        collection = get_collection(self.model)
+        stored = dict((document['number'], document) for document in
+                      collection.find({}, fields=('number',) + IMPORT_FIELDS))
+
+        added = [number for number in stops if number not in stored]
+        removed = [document['_id'] for number, document in stored.items()
+                   if number not in stops]
+        changed = [number for number in stops if number in stored and
+                   any(stored[number].get(field) != stops[number][field]
+                       for field in IMPORT_FIELDS)]
+
+        for batch in _batches(added):
+            collection.insert([dict(stops[number], number=number)
+                               for number in batch])
+        for number in changed:
+            collection.update({'_id': stored[number]['_id']},
+                              {'$set': stops[number]})
+        for batch in _batches(removed):
+            collection.remove({'_id': {'$in': batch}})
+        if added or changed or removed:
+            modelcache.clear(self.model)
+
+        return {'added': len(added),
+                'changed': len(changed),
+                'removed': len(removed),
+                'unchanged': len(stops) - len(added) - len(changed)}
+
 
 class Stop(models.Model, LocationClass):
     number = models.TextField(unique=True)
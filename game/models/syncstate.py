@@ -0,0 +1,29 @@
+import datetime
+
+from django.db import models
+
+
+class SyncStateManager(models.Manager):
+    def get_state(self, name):
+        state, created = self.get_or_create(name=name)
+        return state
+
+
+#Bookkeeping for data pulled in from outside sources
+class SyncState(models.Model):
+    name = models.TextField(unique=True)
+    cursor = models.TextField(null=True)
+    full_sync = models.DateTimeField(null=True)
+
+    objects = SyncStateManager()
+
+    def needs_full_sync(self, interval):
+        """ True if there's no cursor or the last full sync is interval
+        seconds old """
+        if self.cursor is None or self.full_sync is None:
+            return True
+        age = datetime.datetime.now() - self.full_sync
+        return age > datetime.timedelta(seconds=interval)
+
+    class Meta:
+        app_label = "game"
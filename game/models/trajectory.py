@@ -0,0 +1,93 @@
+import datetime
+import time
+
+from django.db import models
+from django.conf import settings
+from djangotoolbox.fields import ListField
+from django_mongodb_engine.contrib import MongoDBManager
+
+from game.util import get_collection
+
+#Each fix takes three slots in a buffer: timestamp, lon, lat
+FIX_WIDTH = 3
+
+
+def _to_timestamp(date):
+    return time.mktime(date.timetuple()) + date.microsecond / 1e6
+
+
+class TrajectoryManager(MongoDBManager):
+    def append_fixes(self, vehicles, timestamp=None):
+        """
+        Record the location of each vehicle at timestamp (a unix time,
+        defaulting to now) in its car's ring buffer, overwriting the oldest
+        fix once the buffer is full. Each fix claims its slot with an
+        atomic $inc of head, so concurrent pollers never write the same
+        one. Buffers hold CAR_TRAJECTORY_SIZE fixes and are allocated in
+        full when created, so writes never grow the document.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        collection = get_collection(self.model)
+        vehicles = dict((vehicle['number'], vehicle) for vehicle in vehicles)
+
+        seen = set()
+        for number, vehicle in vehicles.items():
+            document = collection.find_and_modify(
+                                {'number': number}, {'$inc': {'head': 1}},
+                                fields={'head': 1, 'size': 1}, new=True)
+            if document is None:
+                continue
+            seen.add(number)
+            lon, lat = vehicle['location']
+            start = ((document['head'] - 1) % document['size']) * FIX_WIDTH
+            collection.update({'_id': document['_id']},
+                              {'$set': {'fixes.%d' % start: timestamp,
+                                        'fixes.%d' % (start + 1): lon,
+                                        'fixes.%d' % (start + 2): lat}},
+                              safe=True)
+
+        size = settings.CAR_TRAJECTORY_SIZE
+        new_buffers = []
+        for number, vehicle in vehicles.items():
+            if number in seen:
+                continue
+            fixes = [0.0] * (size * FIX_WIDTH)
+            fixes[:FIX_WIDTH] = [timestamp] + list(vehicle['location'])
+            new_buffers.append({'number': number,
+                                'size': size,
+                                'head': 1,
+                                'fixes': fixes})
+        if new_buffers:
+            collection.insert(new_buffers)
+
+
+class Trajectory(models.Model):
+    number = models.PositiveIntegerField(unique=True)
+    #Number of fixes ever written; the next one goes in slot head % size
+    head = models.IntegerField(default=0)
+    size = models.IntegerField()
+    fixes = ListField()
+
+    objects = TrajectoryManager()
+
+    def between(self, start, end=None):
+        """
+        The (datetime, lon, lat) fixes from start to end, oldest first
+        """
+        start = _to_timestamp(start)
+        end = _to_timestamp(end) if end else time.time()
+
+        count = min(self.head, self.size)
+        first = self.head - count
+        points = []
+        for i in xrange(first, self.head):
+            offset = (i % self.size) * FIX_WIDTH
+            timestamp, lon, lat = self.fixes[offset:offset + FIX_WIDTH]
+            if start <= timestamp <= end:
+                points.append((datetime.datetime.fromtimestamp(timestamp),
+                               lon, lat))
+        return points
+
+    class Meta:
+        app_label = "game"
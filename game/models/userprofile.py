@@ -4,6 +4,10 @@ from djangotoolbox.fields import EmbeddedModelField, ListField
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.conf import settings
+from django_mongodb_engine.contrib import MongoDBManager
+from pymongo.objectid import ObjectId
+
+from game.util import get_collection
 
 
 @receiver(post_save)
@@ -21,11 +25,46 @@ class Riding(models.Model):
     time = models.DateTimeField(auto_now=True)
 
 
+class UserProfileManager(MongoDBManager):
+    def credit(self, profile, amount):
+        """
+        Add amount to profile's balance with an atomic $inc, so concurrent
+        credits and debits are never lost, and bring profile's balance up
+        to date.
+        """
+        document = get_collection(self.model).find_and_modify(
+                            {'_id': ObjectId(profile.pk)},
+                            {'$inc': {'balance': amount}},
+                            fields={'balance': 1}, new=True)
+        profile.balance = document['balance']
+
+    def debit(self, profile, amount):
+        """
+        Take amount from profile's balance with an atomic $inc, but only if
+        the balance covers it. Returns whether it did. profile's balance is
+        brought up to date either way.
+        """
+        collection = get_collection(self.model)
+        spec = {'_id': ObjectId(profile.pk)}
+        document = collection.find_and_modify(
+                            dict(spec, balance={'$gte': amount}),
+                            {'$inc': {'balance': -amount}},
+                            fields={'balance': 1}, new=True)
+        if document is None:
+            document = collection.find_one(spec, fields=('balance',))
+            profile.balance = document['balance']
+            return False
+        profile.balance = document['balance']
+        return True
+
+
 class UserProfile(models.Model):
     balance = models.IntegerField()
     user = models.ForeignKey(User, unique=True)
     riding = EmbeddedModelField(Riding, null=True)
 
+    objects = UserProfileManager()
+
     def check_in(self, car, stop):
         self.riding = Riding(car=car, boarded=stop)
         self.save()
@@ -35,8 +74,9 @@ class UserProfile(models.Model):
             raise self.NotCheckedInException
 
         fare = self.riding.car.ride(self.user, self.riding.boarded, stop)
+        #Saving the whole profile would write back a stale balance
         self.riding = None
-        self.save()
+        UserProfile.objects.filter(pk=self.pk).update(riding=None)
 
         return fare
 
@@ -0,0 +1,42 @@
+from xml.etree.cElementTree import iterparse
+
+
+class VehicleFeed(object):
+    """
+    Iterates over the in service vehicles on the routes in route_list from a
+    NextBus vehicleLocations document, one at a time. Elements are thrown
+    away as soon as they have been read, so memory use doesn't depend on the
+    size of the feed.
+
+    Once iteration is finished last_time holds the feed's lastTime, which
+    can be sent back as t to only get the vehicles that moved since.
+    """
+    def __init__(self, source, route_list):
+        self.source = source
+        self.routes = set(str(route) for route in route_list)
+        self.last_time = None
+
+    def __iter__(self):
+        root = None
+        for event, elem in iterparse(self.source, events=('start', 'end')):
+            if root is None:
+                root = elem
+                continue
+            if event != 'end':
+                continue
+
+            if elem.tag == 'vehicle':
+                if (elem.get('routeTag') in self.routes and
+                    elem.get('predictable') == 'true'):
+                    yield {'number': int(elem.get('id')),
+                           'route': int(elem.get('routeTag')),
+                           #MongoDB indices are lon/lat
+                           'location': [float(elem.get(i))
+                                        for i in ('lon', 'lat')]}
+            elif elem.tag == 'lastTime':
+                self.last_time = elem.get('time')
+            root.clear()
+
+
+def iter_vehicles(source, route_list):
+    return iter(VehicleFeed(source, route_list))
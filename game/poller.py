@@ -0,0 +1,241 @@
+import datetime
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+from urllib2 import urlopen
+
+from django.conf import settings
+
+from game.models import Car, SyncState, Trajectory
+from game.nextbus import VehicleFeed
+from game.spatial import car_index
+
+#Share of the cars in a poll that have to change for the poller to speed up,
+#or that may change at most for it to slow down
+BUSY_FRACTION = 0.5
+QUIET_FRACTION = 0.1
+
+
+class TimedReader(object):
+    """ Wraps a response, adding up the time spent waiting on reads """
+    def __init__(self, response):
+        self.response = response
+        self.elapsed = 0.0
+
+    def read(self, *args):
+        start = time.time()
+        try:
+            return self.response.read(*args)
+        finally:
+            self.elapsed += time.time() - start
+
+
+class CarPoller(object):
+    """
+    Polls the NextBus feed and writes the car positions. The settings and
+    the feed's sync state are read once, so a resident poller only pays for
+    the fetch and the writes on each cycle.
+    """
+    def __init__(self):
+        self.url = settings.NEXTBUS_API_URL
+        self.route_list = settings.NEXTBUS_ROUTE_LIST
+        self.resync_interval = settings.NEXTBUS_RESYNC_INTERVAL
+        self.min_interval = settings.NEXTBUS_POLL_MIN_INTERVAL
+        self.max_interval = settings.NEXTBUS_POLL_MAX_INTERVAL
+        self.interval = settings.NEXTBUS_POLL_INTERVAL
+        self.timeout = settings.NEXTBUS_FETCH_TIMEOUT
+        self.state = SyncState.objects.get_state('nextbus')
+        self.pool = None
+        if settings.NEXTBUS_PARALLEL_ROUTES:
+            self.pool = ThreadPool(settings.NEXTBUS_FETCH_THREADS)
+        #Every active car's (route, lon, lat), for car_index. A poller
+        #started for one poll carries on from the last one's snapshot, and
+        #only reads the cars from MongoDB when there isn't one.
+        self.positions = car_index.published()
+        if self.positions is None:
+            self.positions = dict(
+                (car.number, (car.route, car.location[0], car.location[1]))
+                for car in Car.objects.filter(active=True) if car.location)
+
+    def fetch(self, route, last_time):
+        """
+        Download and parse the vehicles on route ('%' for every route)
+        reported since last_time. Returns a dict with the vehicles, the
+        feed's lastTime and the fetch and parse times in seconds.
+        """
+        start = time.time()
+        url = self.url.format(route=route, last_time=last_time)
+        #HTTP errors and timeouts are IOErrors too
+        try:
+            response = urlopen(url, timeout=self.timeout)
+        except ValueError as e:
+            raise IOError('Bad NextBus URL %s: %s' % (url, e))
+        opened = time.time()
+        try:
+            if response.getcode() not in (None, 200):
+                raise IOError('NextBus returned %s for route %s'
+                              % (response.getcode(), route))
+            reader = TimedReader(response)
+            feed = VehicleFeed(reader, self.route_list)
+            vehicles = list(feed)
+        except SyntaxError as e:
+            raise IOError('Unreadable feed for route %s: %s' % (route, e))
+        finally:
+            response.close()
+        parsed = time.time()
+
+        return {'route': route,
+                'vehicles': vehicles,
+                'last_time': feed.last_time,
+                'fetch': opened - start + reader.elapsed,
+                'parse': parsed - opened - reader.elapsed}
+
+    def fetch_routes(self, last_time):
+        """
+        Fetch every route in route_list on the thread pool. A route that
+        fails, or isn't done within the timeout of the poll, is returned
+        with its IOError under 'error' instead of holding up or failing
+        the others.
+        """
+        def fetch_route(route):
+            try:
+                return self.fetch(route, last_time)
+            except IOError as e:
+                return {'route': route, 'error': e}
+
+        pending = [(route, self.pool.apply_async(fetch_route, (route,)))
+                   for route in self.route_list]
+        deadline = time.time() + self.timeout
+        fetches = []
+        for route, pending_fetch in pending:
+            try:
+                fetches.append(pending_fetch.get(
+                                        max(deadline - time.time(), 0)))
+            except TimeoutError:
+                fetches.append({'route': route, 'error': IOError(
+                                'Route %s timed out' % route)})
+        return fetches
+
+    def poll(self, full=False):
+        """
+        Run one poll. Returns a dict of what changed and how long the
+        fetch, parse and write stages took, in seconds. When routes are
+        fetched in parallel the fetch and parse times are summed over the
+        routes, and 'routes' holds each route's own fetch and parse time.
+        """
+        full = full or self.state.needs_full_sync(self.resync_interval)
+        last_time = 0 if full else self.state.cursor
+        result = {'full': full, 'deactivated': 0, 'routes': {}}
+
+        if self.pool:
+            fetches = self.fetch_routes(last_time)
+        else:
+            fetches = [self.fetch('%', last_time)]
+        failed = [fetch for fetch in fetches if 'error' in fetch]
+        fetches = [fetch for fetch in fetches if 'error' not in fetch]
+        if not fetches:
+            raise failed[0]['error']
+        result['failed'] = [fetch['route'] for fetch in failed]
+
+        vehicles = {}
+        for stage in ('fetch', 'parse'):
+            result[stage] = sum(fetch[stage] for fetch in fetches)
+        for fetch in fetches:
+            for vehicle in fetch['vehicles']:
+                vehicles[vehicle['number']] = vehicle
+            if self.pool:
+                result['routes'][fetch['route']] = (fetch['fetch'] +
+                                                    fetch['parse'])
+
+        vehicles = vehicles.values()
+        start = time.time()
+        result.update(Car.objects.update_positions(vehicles))
+        #Cars the dead band skipped are where their last fix has them
+        written = set(result['written'])
+        Trajectory.objects.append_fixes(vehicle for vehicle in vehicles
+                                        if vehicle['number'] in written)
+        result['cars'] = [vehicle['number'] for vehicle in vehicles]
+
+        #Incremental polls leave out cars that didn't move, so only a full
+        #download says which cars are out of service. Cars on routes that
+        #failed to download are left alone.
+        if full:
+            routes = None
+            if self.pool:
+                routes = [int(fetch['route']) for fetch in fetches]
+            result['deactivated'] = Car.objects.deactivate_missing(
+                                                    result['cars'], routes)
+            if not failed:
+                self.state.full_sync = datetime.datetime.now()
+
+        #Keep the old cursor if a route failed so its changes are fetched
+        #again next time, otherwise take the oldest cursor of the routes
+        last_times = [fetch['last_time'] for fetch in fetches]
+        if not failed:
+            self.state.cursor = (None if None in last_times
+                                 else min(last_times, key=int))
+        self.state.save()
+        result['write'] = time.time() - start
+
+        self.track_positions(vehicles, full, result['failed'])
+        car_index.publish(self.positions)
+        return result
+
+    def track_positions(self, vehicles, full, failed):
+        """
+        Keep positions in line with the active cars. A full poll replaces
+        everything but the cars on routes that failed to download.
+        """
+        if full:
+            failed = set(int(route) for route in failed)
+            self.positions = dict(
+                (number, position)
+                for number, position in self.positions.items()
+                if position[0] in failed)
+        for vehicle in vehicles:
+            self.positions[vehicle['number']] = ((vehicle['route'],) +
+                                                 tuple(vehicle['location']))
+
+    def next_interval(self, result):
+        """
+        Speed up when most cars in service changed, back off when few did.
+        An incremental poll only returns the cars that reported, so the
+        share is of every car tracked, not of the ones in the poll.
+        """
+        changed = (result['inserted'] + result['moved'] +
+                   result['rerouted'] + result['deactivated'])
+        fraction = float(changed) / max(len(self.positions), 1)
+        if fraction >= BUSY_FRACTION:
+            self.interval = max(self.min_interval, self.interval / 2.0)
+        elif fraction <= QUIET_FRACTION:
+            self.interval = min(self.max_interval, self.interval * 1.5)
+        return self.interval
+
+    def run(self, cycles=None, report=None, sleep=time.sleep):
+        """
+        Poll until cycles polls have run, or forever. report is called with
+        each poll's result, or with the exception when the poll failed, e.g.
+        the feed or MongoDB is down, in which case the poller waits the
+        maximum interval.
+        """
+        count = 0
+        while cycles is None or count < cycles:
+            try:
+                result = self.poll()
+            except Exception as e:
+                self.interval = self.max_interval
+                result = e
+            else:
+                self.next_interval(result)
+            if report:
+                report(result, self.interval)
+            count += 1
+            if cycles is None or count < cycles:
+                sleep(self.interval)
+
+    def close(self):
+        """ Stop the fetch threads, once the poller is finished with """
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -3,6 +3,7 @@ from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.conf import settings
 
+from game.identity import get_profile
 from game.models import Stop, Car
 
 
@@ -14,15 +15,24 @@ class StopFindResource(ModelResource):
         return reverse('stop', args=(instance.number,))
 
 
+def stop_find_data(stop):
+    """ A stop as StopFindResource serializes it, for caching """
+    return {'number': stop.number,
+            'route': stop.route,
+            'description': stop.description,
+            'location': stop.location,
+            'url': reverse('stop', args=(stop.number,))}
+
+
 class UserResource(ModelResource):
     model = User
     fields = ('username', 'balance', 'check_out_url')
 
     def balance(self, instance):
-        return instance.get_profile().balance
+        return get_profile(instance).balance
 
     def check_out_url(self, instance):
-        if instance.get_profile().riding == None:
+        if get_profile(instance).riding == None:
             return None
         else:
             return reverse('car-checkout')
@@ -0,0 +1,427 @@
+import heapq
+import threading
+import time
+from collections import defaultdict, namedtuple, OrderedDict
+from math import floor
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from game import metrics
+from game.models import Stop, SyncState
+
+
+class GridIndex(object):
+    """
+    Buckets lon/lat points into square cells cell_size degrees wide for
+    nearest neighbour lookups. Distances are planar in degrees, the same as
+    MongoDB's 2d $near, so results come back in the same order.
+    """
+    def __init__(self, items, cell_size):
+        """ items is an iterable of (location, value) pairs """
+        self.cell_size = float(cell_size)
+        self.cells = defaultdict(list)
+        self.count = 0
+        for location, value in items:
+            self.cells[self.cell(location)].append(
+                (location[0], location[1], value))
+            self.count += 1
+        if self.cells:
+            xs, ys = zip(*self.cells.keys())
+            self.bounds = (min(xs), min(ys), max(xs), max(ys))
+
+    def __len__(self):
+        return self.count
+
+    def cell(self, location):
+        return (int(floor(location[0] / self.cell_size)),
+                int(floor(location[1] / self.cell_size)))
+
+    def _ring(self, centre, radius):
+        # The cells exactly radius cells away from centre
+        cx, cy = centre
+        if radius == 0:
+            yield centre
+            return
+        for x in xrange(cx - radius, cx + radius + 1):
+            yield x, cy - radius
+            yield x, cy + radius
+        for y in xrange(cy - radius + 1, cy + radius):
+            yield cx - radius, y
+            yield cx + radius, y
+
+    def nearest(self, location, limit):
+        """ The values of the limit points closest to location, closest
+        first """
+        if not self.cells or limit <= 0:
+            return []
+        lon, lat = location
+        centre = self.cell(location)
+        min_x, min_y, max_x, max_y = self.bounds
+        #Past this radius every cell has been searched
+        last_radius = max(abs(centre[0] - min_x), abs(centre[0] - max_x),
+                          abs(centre[1] - min_y), abs(centre[1] - max_y))
+
+        found = []
+        radius = 0
+        while radius <= last_radius:
+            for cell in self._ring(centre, radius):
+                for x, y, value in self.cells.get(cell, ()):
+                    found.append(((x - lon) ** 2 + (y - lat) ** 2, value))
+            #Anything in a ring further out is at least this far away
+            reach = radius * self.cell_size
+            if len(found) >= limit:
+                found.sort(key=lambda pair: pair[0])
+                del found[limit:]
+                if found[-1][0] <= reach * reach:
+                    break
+            radius += 1
+
+        found.sort(key=lambda pair: pair[0])
+        return [value for distance, value in found[:limit]]
+
+
+class StopsGeneration(object):
+    """
+    Identifies the current set of stops: the last import recorded in
+    SyncState, checked at most every STOP_INDEX_CHECK_INTERVAL seconds, and
+    a counter bumped whenever stops change in this process. Anything built
+    from the stops is stale once this changes.
+    """
+    def __init__(self):
+        self.imported = None
+        self.local = 0
+        self.checked = 0
+
+    def current(self):
+        now = time.time()
+        if now - self.checked >= settings.STOP_INDEX_CHECK_INTERVAL:
+            self.checked = now
+            try:
+                state = SyncState.objects.get(name='gtfs')
+                self.imported = (state.cursor, state.full_sync)
+            except SyncState.DoesNotExist:
+                self.imported = None
+        return (self.imported, self.local)
+
+    def bump(self):
+        self.local += 1
+
+
+stops_generation = StopsGeneration()
+
+
+class StopIndex(object):
+    """
+    All the stops in a GridIndex, built on the first lookup and rebuilt
+    whenever stops_generation changes.
+    """
+    def __init__(self):
+        self.index = None
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def nearest(self, location, limit):
+        """
+        The limit stops nearest to location, or None if the index is turned
+        off with STOP_INDEX or there are no stops to index, in which case
+        the caller should ask MongoDB.
+        """
+        if not settings.STOP_INDEX:
+            return None
+        self.refresh()
+        index = self.index
+        if not index:
+            return None
+        return index.nearest(location, limit)
+
+    def refresh(self):
+        generation = stops_generation.current()
+        if self.index is not None and generation == self.generation:
+            return
+        with self.lock:
+            if self.index is None or generation != self.generation:
+                self.rebuild(generation)
+
+    def rebuild(self, generation=None):
+        stops = ((stop.location, stop) for stop in Stop.objects.all())
+        self.index = GridIndex(stops, settings.STOP_INDEX_CELL_SIZE)
+        self.generation = generation
+
+
+stop_index = StopIndex()
+
+
+class StopSearchCache(object):
+    """
+    Serialized stop search results, keyed by the STOP_SEARCH_CELL_SIZE
+    degree grid cell the search was made from. Every search from a cell is
+    answered with the stops nearest the cell's centre. The least recently
+    used cells are dropped past STOP_SEARCH_CACHE_SIZE entries, and
+    everything is dropped when stops_generation changes. Hits and misses
+    are counted in game.metrics.
+    """
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.generation = None
+        self.lock = threading.Lock()
+
+    def cell(self, location):
+        size = settings.STOP_SEARCH_CELL_SIZE
+        return tuple(int(floor(coordinate / size)) for coordinate in location)
+
+    def lookup(self, location, limit, search):
+        """
+        The cached results for the cell location is in, or search called
+        with the cell's centre and cached.
+        """
+        max_size = settings.STOP_SEARCH_CACHE_SIZE
+        if not max_size:
+            return search(location)
+
+        generation = stops_generation.current()
+        key = (self.cell(location), limit)
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+            results = self.entries.pop(key, None)
+            if results is not None:
+                self.entries[key] = results
+        if results is not None:
+            metrics.incr('stop_search.hits')
+            return results
+
+        metrics.incr('stop_search.misses')
+        size = settings.STOP_SEARCH_CELL_SIZE
+        results = search([(i + 0.5) * size for i in key[0]])
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = results
+                while len(self.entries) > max_size:
+                    self.entries.popitem(last=False)
+        return results
+
+
+stop_search_cache = StopSearchCache()
+
+
+@receiver(post_save, sender=Stop)
+@receiver(post_delete, sender=Stop)
+def stops_changed(sender, **kwargs):
+    stops_generation.bump()
+
+
+CarPosition = namedtuple('CarPosition', 'number route location changed')
+
+
+def parse_bbox(value):
+    """
+    A "min lon,min lat,max lon,max lat" bounding box as a list of floats,
+    ValueError otherwise
+    """
+    bbox = [float(i) for i in value.split(',')]
+    if len(bbox) != 4 or bbox[0] > bbox[2] or bbox[1] > bbox[3]:
+        raise ValueError('Invalid bbox %r' % value)
+    return bbox
+
+
+def in_bbox(location, bbox):
+    min_lon, min_lat, max_lon, max_lat = bbox
+    return (min_lon <= location[0] <= max_lon and
+            min_lat <= location[1] <= max_lat)
+
+
+class CarIndex(object):
+    """
+    The positions of the active cars bucketed by route, so the cars nearest
+    a stop can be found without asking MongoDB. The poller publishes a
+    snapshot of every active car after each poll through the cache named
+    by CAR_INDEX_CACHE, and other processes pick up new snapshots at most
+    every CAR_INDEX_CHECK_INTERVAL seconds. That cache has to be shared
+    between processes, such as memcached, for web processes to see them.
+
+    Each car carries the version of the snapshot it last moved or changed
+    route in, and the snapshot the versions the cars taken out of service
+    in the last CAR_INDEX_MAX_AGE seconds left in, so clients can ask for
+    what changed since a version they were sent.
+    """
+    cache_key = 'game.car_index'
+
+    def __init__(self):
+        #(version, timestamp, cars by route, cars by number, removed cars'
+        #versions by number, the oldest version changes are known since),
+        #swapped in as a whole
+        self.current = None
+        self.checked = 0
+        self._cache = None
+
+    @property
+    def cache(self):
+        #Looked up when first used, once the settings are loaded
+        if self._cache is None:
+            self._cache = get_cache(settings.CAR_INDEX_CACHE)
+        return self._cache
+
+    def publish(self, positions, timestamp=None):
+        """
+        Publish a snapshot of positions, a dict of car number to (route,
+        lon, lat), taken at timestamp (default now). Changes are tracked
+        from the last snapshot published, by this process or an earlier
+        one, as a poller started for each poll is.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        version = int(timestamp * 1000)
+        published = self.cache.get(self.cache_key)
+        if published is not None and (self.current is None or
+                                      published['version'] > self.current[0]):
+            self.load(published)
+        current = self.current
+        if current is None:
+            previous, removed, tracked = {}, {}, version
+        else:
+            previous, tracked = current[3], current[5]
+            oldest = version - settings.CAR_INDEX_MAX_AGE * 1000
+            removed = dict((number, changed)
+                           for number, changed in current[4].items()
+                           if changed > oldest and number not in positions)
+            for number, car in previous.items():
+                if number not in positions:
+                    removed[number] = version
+
+        cars = []
+        for number, position in positions.items():
+            route, lon, lat = position
+            car = previous.get(number)
+            if car is not None and (car.route, car.location) == (route,
+                                                                 [lon, lat]):
+                changed = car.changed
+            else:
+                changed = version
+            cars.append((number, route, lon, lat, changed))
+
+        snapshot = {'version': version, 'timestamp': timestamp, 'cars': cars,
+                    'removed': removed, 'tracked': tracked}
+        self.cache.set(self.cache_key, snapshot, settings.CAR_INDEX_MAX_AGE)
+        self.load(snapshot)
+
+    def published(self):
+        """
+        The positions in the last snapshot published, as publish takes them,
+        or None if there isn't one. The snapshot is loaded, so the changes
+        in the next publish are tracked from it.
+        """
+        snapshot = self.cache.get(self.cache_key)
+        if snapshot is None:
+            return None
+        self.load(snapshot)
+        return dict((number, (route, lon, lat))
+                    for number, route, lon, lat, changed in snapshot['cars'])
+
+    def load(self, snapshot):
+        routes = defaultdict(list)
+        cars = {}
+        for number, route, lon, lat, changed in snapshot['cars']:
+            car = CarPosition(number, route, [lon, lat], changed)
+            routes[route].append(car)
+            cars[number] = car
+        self.current = (snapshot['version'], snapshot['timestamp'],
+                        dict(routes), cars, snapshot['removed'],
+                        snapshot['tracked'])
+
+    def refresh(self):
+        now = time.time()
+        if now - self.checked < settings.CAR_INDEX_CHECK_INTERVAL:
+            return
+        self.checked = now
+        snapshot = self.cache.get(self.cache_key)
+        if snapshot is None:
+            self.current = None
+        elif self.current is None or snapshot['version'] != self.current[0]:
+            self.load(snapshot)
+
+    def age(self):
+        """ Seconds since the snapshot in use was taken, None without one """
+        current = self.current
+        if current is None:
+            return None
+        return time.time() - current[1]
+
+    def nearest(self, location, route, limit):
+        """
+        The limit active cars on route closest to location, closest first,
+        as CarPositions. None if the index is turned off with CAR_INDEX or
+        there's no snapshot newer than CAR_INDEX_MAX_AGE seconds, in which
+        case the caller should ask MongoDB.
+        """
+        current = self.usable()
+        if current is None:
+            return None
+        lon, lat = location
+        return heapq.nsmallest(limit, current[2].get(route, ()),
+                               key=lambda car: (car.location[0] - lon) ** 2 +
+                                               (car.location[1] - lat) ** 2)
+
+    def cars(self):
+        """
+        The version of the snapshot in use and its cars as a dict of number
+        to CarPosition, or None when nearest would be
+        """
+        current = self.usable()
+        if current is None:
+            return None
+        return current[0], current[3]
+
+    def in_bbox(self, bbox, since=None):
+        """
+        The version of the snapshot in use, the since used, the cars in bbox
+        as CarPositions and the numbers of cars to take off a map showing
+        bbox, or None when nearest would be. Given the version of an earlier
+        snapshot as since, only the cars that changed after it are returned,
+        and those that changed but are now out of bbox or service are the
+        numbers to remove. If the changes since then aren't known, since is
+        ignored and returned as None, and every car in bbox is returned.
+        """
+        current = self.usable()
+        if current is None:
+            return None
+        version, cars, removed, tracked = (current[0], current[3],
+                                           current[4], current[5])
+        oldest = max(tracked, version - settings.CAR_INDEX_MAX_AGE * 1000)
+        if since is not None and not oldest <= since <= version:
+            since = None
+
+        found, gone = [], []
+        for car in cars.itervalues():
+            if since is not None and car.changed <= since:
+                continue
+            if in_bbox(car.location, bbox):
+                found.append(car)
+            elif since is not None:
+                gone.append(car.number)
+        if since is not None:
+            gone.extend(number for number, changed in removed.items()
+                        if changed > since)
+        return version, since, found, gone
+
+    def usable(self):
+        #The current snapshot if it's turned on and not too old
+        if not settings.CAR_INDEX:
+            return None
+        self.refresh()
+        current = self.current
+        if (current is None or
+            time.time() - current[1] > settings.CAR_INDEX_MAX_AGE):
+            return None
+        return current
+
+    def clear(self):
+        self.cache.delete(self.cache_key)
+        self.current = None
+        self.checked = 0
+
+
+car_index = CarIndex()
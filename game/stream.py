@@ -0,0 +1,85 @@
+"""
+Server-sent events of car positions for the fleet map. Every connection
+reads the poller's snapshots from car_index, which each process fetches at
+most every CAR_INDEX_CHECK_INTERVAL seconds however many are connected, so
+a poll reaches every client without a query per client.
+"""
+import json
+import time
+
+from django.conf import settings
+
+from game.spatial import car_index, in_bbox
+
+
+def server_event(event, data, event_id=None):
+    """ One event in the text/event-stream format """
+    lines = []
+    if event_id is not None:
+        lines.append('id: %s' % event_id)
+    lines.append('event: %s' % event)
+    lines.append('data: %s' % json.dumps(data, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+class CarStream(object):
+    """
+    Iterates over the server-sent events for the cars in numbers, or in
+    bbox (min lon, min lat, max lon, max lat) without numbers. The first
+    event has every car, later ones only the cars that moved, changed route
+    or appeared since, as [number, lon, lat, route] rows, and the numbers of
+    the ones that went out of service or out of view. The stream ends after
+    CAR_STREAM_MAX_AGE seconds and the browser reconnects, which also picks
+    up changes in the cars owned. Without a usable snapshot the stream
+    ends, and the browser tries again CAR_STREAM_KEEPALIVE seconds later.
+    """
+    def __init__(self, numbers=None, bbox=None, sleep=time.sleep,
+                 clock=time.time):
+        self.numbers = numbers
+        self.bbox = bbox
+        self.sleep = sleep
+        self.clock = clock
+
+    def watched(self, cars):
+        if self.numbers is not None:
+            return (cars[number] for number in self.numbers
+                    if number in cars)
+        return (car for car in cars.itervalues()
+                if in_bbox(car.location, self.bbox))
+
+    def __iter__(self):
+        start = last_write = self.clock()
+        #What the client has been sent, number: (lon, lat, route)
+        sent = {}
+        version = None
+        started = False
+        yield 'retry: %d\n\n' % (settings.CAR_STREAM_INTERVAL * 1000)
+        while self.clock() - start < settings.CAR_STREAM_MAX_AGE:
+            snapshot = car_index.cars()
+            if snapshot is None:
+                #Nothing to send until the poller publishes again, so have
+                #the browser come back later rather than hold a worker
+                yield 'retry: %d\n\n' % (settings.CAR_STREAM_KEEPALIVE * 1000)
+                return
+            if snapshot[0] != version:
+                version, cars = snapshot
+                seen = {}
+                moved = []
+                for car in self.watched(cars):
+                    row = (car.location[0], car.location[1], car.route)
+                    seen[car.number] = row
+                    if sent.get(car.number) != row:
+                        moved.append([car.number] + list(row))
+                removed = [number for number in sent if number not in seen]
+                sent = seen
+                if moved or removed or not started:
+                    started = True
+                    last_write = self.clock()
+                    yield server_event('positions',
+                                       {'version': version,
+                                        'cars': moved,
+                                        'removed': removed}, version)
+            if self.clock() - last_write >= settings.CAR_STREAM_KEEPALIVE:
+                last_write = self.clock()
+                yield ': keepalive\n\n'
+            self.sleep(settings.CAR_STREAM_INTERVAL)
@@ -2,3 +2,12 @@ from models import *
 from rules import *
 from management.commands import *
 from views import *
+from nextbus import *
+from poller import *
+from gtfs import *
+from distance import *
+from spatial import *
+from emitter import *
+from identity import *
+from modelcache import *
+from stream import *
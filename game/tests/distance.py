@@ -0,0 +1,43 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+from django.utils import unittest
+
+from game.distance import distance, ellipsoidal, haversine, pairwise, numpy
+from game.tests.utils import temporary_settings
+
+BATHURST_STATION = (-79.411286, 43.666532)
+BATHURST_AND_KING = (-79.402858, 43.644075)
+SPADINA_AND_DUNDAS = (-79.397997, 43.652513)
+
+
+class DistanceTests(TestCase):
+    def test_haversine_close_to_ellipsoidal(self):
+        for a, b in ((BATHURST_STATION, BATHURST_AND_KING),
+                     (BATHURST_AND_KING, SPADINA_AND_DUNDAS)):
+            exact = ellipsoidal(a, b)
+            self.assertAlmostEqual(haversine(a, b), exact,
+                                   delta=exact * 0.003)
+
+    def test_haversine_same_point_is_zero(self):
+        self.assertEquals(haversine(BATHURST_STATION, BATHURST_STATION), 0)
+
+    def test_distance_uses_setting(self):
+        a, b = BATHURST_STATION, BATHURST_AND_KING
+        with temporary_settings({'DISTANCE_ENGINE': 'ellipsoidal'}):
+            self.assertEquals(distance(a, b), ellipsoidal(a, b))
+        with temporary_settings({'DISTANCE_ENGINE': 'haversine'}):
+            self.assertEquals(distance(a, b), haversine(a, b))
+        with temporary_settings({'DISTANCE_ENGINE': 'flat'}):
+            with self.assertRaises(ImproperlyConfigured):
+                distance(a, b)
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_pairwise_matches_haversine(self):
+        origins = [BATHURST_STATION, BATHURST_AND_KING]
+        destinations = [BATHURST_AND_KING, SPADINA_AND_DUNDAS,
+                        BATHURST_STATION]
+        distances = pairwise(origins, destinations)
+        self.assertEquals(distances.shape, (2, 3))
+        for i, a in enumerate(origins):
+            for j, b in enumerate(destinations):
+                self.assertAlmostEqual(distances[i][j], haversine(a, b))
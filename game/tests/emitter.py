@@ -0,0 +1,90 @@
+import time
+
+from django.test import TestCase
+from pymongo.errors import AutoReconnect
+from django.contrib.auth.models import User
+
+from game import metrics
+from game.emitter import emitter
+from game.models import Car, Event
+from game.tests.utils import temporary_settings
+
+
+class EventEmitterTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.user = User.objects.create(username='joe',
+                                        email='joe@bloggs.com',
+                                        password='secret')
+        self.car = Car.objects.create(number=4211,
+                                      active=True,
+                                      location=[-79.402858, 43.644075],)
+
+    def test_sync_mode_inserts_straight_away(self):
+        event = Event.objects.add_car_sold(self.car, self.user, 10)
+        self.assertEquals(Event.objects.get(pk=event.pk).data['price'], 10)
+
+    def test_queued_events_written_on_flush(self):
+        with temporary_settings({'EVENT_EMITTER_SYNC': False,
+                                 'EVENT_BATCH_SIZE': 3}):
+            events = [Event.objects.add_car_sold(self.car, self.user, price)
+                      for price in range(10)]
+            emitter.flush()
+        stored = Event.objects.filter(event='car_sold')
+        self.assertEquals(sorted(event.pk for event in stored),
+                          sorted(event.pk for event in events))
+        self.assertEquals(events[0].date, Event.objects.get(
+                                                pk=events[0].pk).date)
+
+        snapshot = metrics.snapshot()
+        self.assertEquals(snapshot['counters']['events.written'], 10)
+        self.assertEquals(snapshot['gauges']['events.queue_depth'], 0)
+        self.assertGreaterEqual(snapshot['timers']['events.flush']['calls'],
+                                4)
+
+    def test_full_queue_inserts_in_caller(self):
+        with temporary_settings({'EVENT_EMITTER_SYNC': False}):
+            emitter.start()
+            queue = emitter.queue
+            #Stand in for a queue the worker can't keep up with
+            emitter.queue = type(queue)(1)
+            emitter.queue.put(None)
+            try:
+                event = Event.objects.add_car_sold(self.car, self.user, 10)
+            finally:
+                emitter.queue = queue
+        self.assertTrue(Event.objects.filter(pk=event.pk).exists())
+        self.assertEquals(metrics.snapshot()['counters']['events.overflow'],
+                          1)
+
+    def test_failed_batch_holds_back_the_queue(self):
+        failing = [True]
+        insert = emitter.insert
+
+        def flaky_insert(documents):
+            if failing[0]:
+                raise AutoReconnect('connection refused')
+            insert(documents)
+
+        with temporary_settings({'EVENT_EMITTER_SYNC': False,
+                                 'EVENT_FLUSH_INTERVAL': 0.01}):
+            emitter.insert = flaky_insert
+            try:
+                events = [Event.objects.add_car_sold(self.car, self.user, 0)]
+                deadline = time.time() + 5
+                while not emitter.retry and time.time() < deadline:
+                    time.sleep(0.01)
+                events.extend(Event.objects.add_car_sold(self.car, self.user,
+                                                         price)
+                              for price in range(1, 5))
+                time.sleep(0.1)
+                self.assertEquals(len(emitter.retry), 1)
+                self.assertEquals(emitter.queue.qsize(), 4)
+
+                failing[0] = False
+                emitter.flush()
+            finally:
+                del emitter.insert
+        self.assertEquals(Event.objects.filter(event='car_sold').count(), 5)
+        self.assertGreaterEqual(
+                        metrics.snapshot()['counters']['events.failed'], 1)
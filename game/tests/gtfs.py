@@ -0,0 +1,51 @@
+from StringIO import StringIO
+from zipfile import ZipFile
+
+from django.test import TestCase
+
+from game.gtfs import find_stops, read_table
+
+
+class GtfsTests(TestCase):
+    def setUp(self):
+        data = StringIO()
+        with ZipFile(data, 'w') as archive:
+            archive.writestr('trips.txt',
+                'route_id,service_id,trip_id,trip_headsign\n'
+                '19379,4,1,"504 KING, TOWARDS DUNDAS WEST"\n'
+                '19380,4,2,"29 DUFFERIN TOWARDS DUFFERIN GATE"\n')
+            archive.writestr('stop_times.txt',
+                'trip_id,arrival_time,departure_time,stop_id\n'
+                '1,5:02:44,5:02:44,100\n'
+                '\n'
+                '2,5:03:28,5:03:28,200\n')
+            archive.writestr('stops.txt',
+                'stop_id,stop_code,stop_name,stop_desc,stop_lat,stop_lon\n'
+                '100,01234,"KING ST WEST AT SHAW ST, EAST SIDE",,43.64,-79.41\n'
+                '200,05678,DUFFERIN ST AT KING ST,,43.64,-79.43\n')
+        self.archive = ZipFile(data)
+
+    def test_read_table_honours_quoting(self):
+        rows = list(read_table(self.archive, 'stops.txt'))
+        self.assertEquals(rows[1][2], 'KING ST WEST AT SHAW ST, EAST SIDE')
+        self.assertEquals(len(rows[1]), 6)
+
+    def test_find_stops(self):
+        stops = find_stops(self.archive, ['504'])
+        self.assertEquals(stops, {'01234': {
+            'description': 'King St West At Shaw St, East Side',
+            'location': [-79.41, 43.64],
+            'route': 504}})
+
+    def test_quoted_newlines_kept_when_filtering(self):
+        data = StringIO()
+        with ZipFile(data, 'w') as archive:
+            archive.writestr('stop_times.txt',
+                'trip_id,arrival_time,departure_time,stop_id\n'
+                '1,5:02:44,5:02:44,"100\n2,5:03:28"\n'
+                '2,5:03:28,5:03:28,200\n'
+                '1,5:04:00,5:04:00,300\n')
+        rows = list(read_table(ZipFile(data), 'stop_times.txt',
+                               first_in=set(['1'])))
+        self.assertIn(['1', '5:02:44', '5:02:44', '100\n2,5:03:28'], rows)
+        self.assertIn(['1', '5:04:00', '5:04:00', '300'], rows)
@@ -0,0 +1,51 @@
+from django.core.urlresolvers import reverse
+
+from game.models import Car, Stop, UserProfile
+from game.tests.utils import count_instances, temporary_settings
+from game.tests.views.api.common import ApiTests
+
+
+class ProfileIdentityTests(ApiTests):
+    def setUp(self):
+        super(ProfileIdentityTests, self).setUp()
+        self.car = Car.objects.create(number=4211, route=511, active=True,
+                                      location=[-79.402858, 43.644075])
+        self.stop = Stop.objects.create(number='00258', route=511,
+                                        location=[-79.411286, 43.666532])
+
+    def assertProfileLoads(self, count, method, name, args=(), data=None):
+        with count_instances(UserProfile) as profiles:
+            response = getattr(self.client, method)(
+                                reverse(name, args=args), data or {},
+                                HTTP_AUTHORIZATION=self.auth_string)
+        self.assertStatusCode(response, 200)
+        self.assertEquals(profiles.count, count)
+
+    def test_api_loads_profile_once(self):
+        self.assertProfileLoads(1, 'get', 'user')
+        self.assertProfileLoads(1, 'get', 'user-car-list')
+        self.assertProfileLoads(1, 'get', 'stop', (self.stop.number,))
+        self.assertProfileLoads(1, 'post', 'car-checkin', (self.car.number,),
+                                {'stop_number': self.stop.number})
+
+    def test_checkout_loads_profile_once(self):
+        profile = UserProfile.objects.get(user=self.user)
+        profile.check_in(self.car, self.stop)
+        balance = profile.balance
+
+        def fake_fare(*args, **kwargs):
+            return 5
+        with temporary_settings({'RULE_FIND_FARE': fake_fare}):
+            self.assertProfileLoads(1, 'post', 'car-checkout',
+                                    data={'stop_number': self.stop.number})
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEquals(profile.balance, balance - 5)
+        self.assertIsNone(profile.riding)
+
+    def test_page_and_middleware_share_profile(self):
+        self.client.login(username='apitest', password='secret')
+        with count_instances(UserProfile) as profiles:
+            response = self.client.get(reverse('fleet'))
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(profiles.count, 1)
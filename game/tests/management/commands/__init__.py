@@ -1,2 +1,4 @@
 from updatecars import *
 from updatestops import *
+from backfillrollups import *
+from exportevents import *
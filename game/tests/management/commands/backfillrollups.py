@@ -0,0 +1,57 @@
+import datetime
+
+from django.core import management
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from game.models import Car, Event, Rollup
+from game.util import get_collection
+from updatecars import NullStream
+
+
+class BackfillRollupsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='joe',
+                                        email='joe@bloggs.com',
+                                        password='secret')
+        self.car = Car.objects.create(number=4211,
+                                      route=511,
+                                      active=True,
+                                      location=[-79.402858, 43.644075],)
+        #Only hours that have ended are rebuilt
+        self.date = datetime.datetime.now() - datetime.timedelta(hours=2)
+        self.since = self.date - datetime.timedelta(hours=1)
+
+    def test_backfill_rebuilds_rollups(self):
+        get_collection(Event).insert({'event': 'car_sold',
+                                      'date': self.date,
+                                      'data': {'car': 4211, 'route': 511,
+                                               'user': self.user.id,
+                                               'price': 200}})
+        #Rides recorded before events carried the route
+        get_collection(Event).insert({'event': 'car_ride',
+                                      'date': self.date,
+                                      'data': {'car': 4211, 'fare': 4,
+                                               'traveled': 2.0}})
+        Rollup.objects.all().delete()
+
+        management.call_command('backfillrollups', stdout=NullStream())
+        management.call_command('backfillrollups', stdout=NullStream())
+
+        totals = Rollup.objects.totals('route', [511], self.since)[511]
+        self.assertEquals(totals['riders'], 1)
+        self.assertEquals(totals['revenue'], 4)
+        self.assertEquals(totals['sales'], 1)
+
+    def test_backfill_leaves_current_hour(self):
+        #Kept up to date by the emitter while the backfill runs
+        Event.objects.add_car_sold(self.car, self.user, 200)
+        #Left from events that are gone
+        Rollup.objects.create(kind='car', key='4212', hour=self.date.replace(
+                                minute=0, second=0, microsecond=0), sales=3)
+
+        management.call_command('backfillrollups', stdout=NullStream())
+
+        totals = Rollup.objects.totals('car', [4211, 4212], self.since)
+        self.assertEquals(totals[4211]['sales'], 1)
+        self.assertEquals(totals[4212]['sales'], 0)
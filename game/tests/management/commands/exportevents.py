@@ -0,0 +1,36 @@
+import gzip
+import json
+from StringIO import StringIO
+
+from django.core import management
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from game.models import Car, Event
+
+
+class ExportEventsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='joe',
+                                        email='joe@bloggs.com',
+                                        password='secret')
+        car = Car.objects.create(number=4211, route=511, active=True,
+                                 location=[-79.402858, 43.644075])
+        Event.objects.all().delete()
+        Event.objects.add_car_bought(car, self.user, 200)
+        Event.objects.add_car_sold(car, self.user, 200)
+
+    def test_export(self):
+        output = StringIO()
+        management.call_command('exportevents', stdout=output)
+        lines = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEquals([line['event'] for line in lines],
+                          ['car_bought', 'car_sold'])
+        self.assertEquals(lines[0]['data']['user'], self.user.id)
+
+    def test_gzip_export(self):
+        output = StringIO()
+        management.call_command('exportevents', stdout=output, gzip=True,
+                                events=['car_sold'])
+        content = gzip.GzipFile(fileobj=StringIO(output.getvalue())).read()
+        self.assertEquals(len(content.splitlines()), 1)
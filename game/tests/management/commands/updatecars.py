@@ -4,10 +4,15 @@ from django.conf import settings
 from django.core import management
 from django.test import TestCase
 
-from game.models import Car
+from game.models import Car, SyncState
+from game.spatial import car_index
 from game.tests.utils import temporary_settings
 
-XML_FILE = os.path.dirname(__file__) + '/test-updatecars.xml'
+#The feed is fetched with urllib2, which needs file paths as URLs
+XML_FILE = 'file://' + os.path.abspath(os.path.dirname(__file__) +
+                                       '/test-updatecars.xml')
+LAST_TIME_XML_FILE = 'file://' + os.path.abspath(
+            os.path.dirname(__file__) + '/test-updatecars-lasttime.xml')
 
 
 #can't have any output clogging our unit testing
@@ -56,3 +61,119 @@ class UpdateCarsTests(TestCase):
         with self.temporary_settings:
             management.call_command('updatecars', stdout=NullStream())
         self.assertFalse(Car.objects.get(number=number).active)
+
+    def tearDown(self):
+        car_index.clear()
+
+    def test_new_cars_have_fare_info(self):
+        car = Car.objects.get(number=4095)
+        for fare_info in (car.owner_fares, car.total_fares):
+            self.assertEquals(fare_info.riders, 0)
+            self.assertEquals(fare_info.revenue, 0)
+
+
+class IncrementalUpdateCarsTests(TestCase):
+    def setUp(self):
+        self.temporary_settings = temporary_settings(
+                                {'NEXTBUS_API_URL': LAST_TIME_XML_FILE,
+                                 'NEXTBUS_ROUTE_LIST': ("501", "511")})
+        with self.temporary_settings:
+            management.call_command('updatecars', stdout=NullStream())
+        self.missing = Car.objects.create(number=4111,
+                                          route=511,
+                                          location=(0, 0),
+                                          active=True,)
+
+    def test_last_time_stored(self):
+        state = SyncState.objects.get(name='nextbus')
+        self.assertEquals(state.cursor, '1326218733112')
+        self.assertIsNotNone(state.full_sync)
+
+    def test_incremental_update_leaves_missing_cars_active(self):
+        with self.temporary_settings:
+            management.call_command('updatecars', stdout=NullStream())
+        self.assertTrue(Car.objects.get(number=self.missing.number).active)
+
+    def test_full_update_marks_missing_cars_inactive(self):
+        with self.temporary_settings:
+            management.call_command('updatecars', stdout=NullStream(),
+                                    full=True)
+        self.assertFalse(Car.objects.get(number=self.missing.number).active)
+
+    def test_resync_after_interval(self):
+        with temporary_settings({'NEXTBUS_API_URL': LAST_TIME_XML_FILE,
+                                 'NEXTBUS_ROUTE_LIST': ("501", "511"),
+                                 'NEXTBUS_RESYNC_INTERVAL': -1}):
+            management.call_command('updatecars', stdout=NullStream())
+        self.assertFalse(Car.objects.get(number=self.missing.number).active)
+
+    def tearDown(self):
+        car_index.clear()
+
+
+class BulkPositionTests(TestCase):
+    def setUp(self):
+        self.car = Car.objects.create(number=4095,
+                                      route=501,
+                                      location=[-79.4, 43.6],
+                                      active=True)
+
+    def test_update_positions_counts(self):
+        counts = Car.objects.update_positions([
+            {'number': 4095, 'route': 501, 'location': [-79.5, 43.7]},
+            {'number': 4212, 'route': 511, 'location': [-79.2, 43.6]}])
+        self.assertItemsEqual(counts.pop('written'), [4095, 4212])
+        self.assertEquals(counts, {'inserted': 1, 'moved': 1, 'rerouted': 0,
+                                   'refreshed': 0, 'skipped': 0})
+        self.assertEquals(Car.objects.get(number=4095).location, [-79.5, 43.7])
+        self.assertTrue(Car.objects.get(number=4212).active)
+
+        counts = Car.objects.update_positions([
+            {'number': 4095, 'route': 501, 'location': [-79.5, 43.7]}])
+        self.assertEquals(counts.pop('written'), [])
+        self.assertEquals(counts, {'inserted': 0, 'moved': 0, 'rerouted': 0,
+                                   'refreshed': 0, 'skipped': 1})
+
+    def test_small_moves_skipped(self):
+        Car.objects.update_positions([
+            {'number': 4095, 'route': 501, 'location': [-79.4, 43.6]}])
+        #About 5 metres east
+        nudged = [-79.39994, 43.6]
+        with temporary_settings({'CAR_MOVE_THRESHOLD': 15}):
+            counts = Car.objects.update_positions([
+                {'number': 4095, 'route': 501, 'location': nudged}])
+        self.assertEquals(counts['skipped'], 1)
+        self.assertEquals(Car.objects.get(number=4095).location, [-79.4, 43.6])
+
+        with temporary_settings({'CAR_MOVE_THRESHOLD': 1}):
+            counts = Car.objects.update_positions([
+                {'number': 4095, 'route': 501, 'location': nudged}])
+        self.assertEquals(counts['moved'], 1)
+        self.assertEquals(Car.objects.get(number=4095).location, nudged)
+
+    def test_route_change_written(self):
+        Car.objects.update_positions([
+            {'number': 4095, 'route': 501, 'location': [-79.4, 43.6]}])
+        counts = Car.objects.update_positions([
+            {'number': 4095, 'route': 504, 'location': [-79.4, 43.6]}])
+        self.assertEquals(counts['rerouted'], 1)
+        self.assertEquals(counts['refreshed'], 0)
+        self.assertEquals(Car.objects.get(number=4095).route, 504)
+
+    def test_stale_cars_refreshed(self):
+        #The car from setUp has never been written by the poller
+        counts = Car.objects.update_positions([
+            {'number': 4095, 'route': 501, 'location': [-79.4, 43.6]}])
+        self.assertEquals(counts['refreshed'], 1)
+
+        with temporary_settings({'CAR_MAX_STALENESS': -1}):
+            counts = Car.objects.update_positions([
+                {'number': 4095, 'route': 501, 'location': [-79.4, 43.6]}])
+        self.assertEquals(counts['refreshed'], 1)
+
+    def test_deactivate_missing(self):
+        Car.objects.create(number=4212, route=511, location=[0, 0],
+                           active=True)
+        self.assertEquals(Car.objects.deactivate_missing([4212]), 1)
+        self.assertFalse(Car.objects.get(number=4095).active)
+        self.assertTrue(Car.objects.get(number=4212).active)
@@ -6,7 +6,7 @@ from django.conf import settings
 from django.core import management
 from django.test import TestCase
 
-from game.models import Stop
+from game.models import Stop, SyncState
 from game.tests.utils import temporary_settings
 from updatecars import NullStream
 
@@ -23,7 +23,9 @@ class UpdateStopsTests(TestCase):
         with ZipFile(THIS_DIR + GTFS_ZIP, 'w') as gtfszip:
             for txt in glob.glob(THIS_DIR + GTFS_SUBDIR + '/*.txt'):
                 gtfszip.write(txt, os.path.basename(txt))
-        with temporary_settings({'GTFS_URL': THIS_DIR + GTFS_ZIP}):
+        self.temporary_settings = temporary_settings(
+                                    {'GTFS_URL': THIS_DIR + GTFS_ZIP})
+        with self.temporary_settings:
             management.call_command('updatestops', stdout=NullStream())
 
     def test_correct_number_stops_created(self):
@@ -47,6 +49,31 @@ class UpdateStopsTests(TestCase):
             for key, val in vals.items():
                 self.assertEquals(getattr(stop, key), val)
 
+    def test_unchanged_archive_skipped(self):
+        Stop.objects.get(number='08121').delete()
+        with self.temporary_settings:
+            management.call_command('updatestops', stdout=NullStream())
+        self.assertEquals(Stop.objects.count(), 2)
+        self.assertIsNotNone(SyncState.objects.get(name='gtfs').cursor)
+
+    def test_forced_import_applies_differences(self):
+        extra = Stop.objects.create(number='99999', description='Gone',
+                                    location=[0, 0], route=501)
+        moved = Stop.objects.get(number='13672')
+        moved.location = [0, 0]
+        moved.save()
+        untouched = Stop.objects.get(number='00217')
+
+        with self.temporary_settings:
+            management.call_command('updatestops', stdout=NullStream(),
+                                    force=True)
+        self.assertEquals(Stop.objects.count(), 3)
+        self.assertFalse(Stop.objects.filter(number=extra.number).exists())
+        self.assertEquals(Stop.objects.get(number='13672').location,
+                          [-79.400459, 43.63868])
+        #Unchanged stops keep their documents
+        self.assertEquals(Stop.objects.get(number='00217').pk, untouched.pk)
+
     #We don't need to test for invalids, as we've tested every item in the DB
     def tearDown(self):
         pass
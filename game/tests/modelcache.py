@@ -0,0 +1,68 @@
+from django.test import TestCase
+from djangorestframework.response import ErrorResponse
+
+from game import metrics, modelcache
+from game.models import Car, Stop
+from game.util import get_collection, get_model_or_404
+from game.tests.utils import temporary_settings
+
+
+class ModelCacheTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        modelcache.clear(Car)
+        self.car = Car.objects.create(number=4211, route=511, active=True,
+                                      location=[-79.402858, 43.644075])
+        self.temporary_settings = temporary_settings({'MODEL_CACHE_SIZE': 10})
+        self.temporary_settings.__enter__()
+
+    def test_lookups_cached(self):
+        first = get_model_or_404(Car, number='4211')
+        second = get_model_or_404(Car, number=4211)
+        self.assertEquals(first, second)
+        self.assertIsNot(first, second)
+
+        counters = metrics.snapshot()['counters']
+        self.assertEquals(counters['model_cache.Car.misses'], 1)
+        self.assertEquals(counters['model_cache.Car.hits'], 1)
+        timer = metrics.snapshot()['timers']['model_cache.Car.lookup']
+        self.assertEquals(timer['calls'], 2)
+
+    def test_missing_not_cached(self):
+        self.assertRaises(ErrorResponse, get_model_or_404, Stop, number='1')
+        Stop.objects.create(number='1', route=511, location=[-79.4, 43.6])
+        self.assertEquals(get_model_or_404(Stop, number='1').route, 511)
+
+    def test_save_invalidates(self):
+        get_model_or_404(Car, number=4211)
+        self.car.route = 510
+        self.car.save()
+        self.assertEquals(get_model_or_404(Car, number=4211).route, 510)
+
+    def test_bulk_writes_invalidate(self):
+        get_model_or_404(Car, number=4211)
+        Car.objects.update_positions([{'number': 4211, 'route': 511,
+                                       'location': [-79.39, 43.65]}])
+        self.assertEquals(get_model_or_404(Car, number=4211).location,
+                          [-79.39, 43.65])
+
+        Car.objects.deactivate_missing([])
+        self.assertFalse(get_model_or_404(Car, number=4211).active)
+
+    def test_shared_tier(self):
+        with temporary_settings({'MODEL_CACHE_SHARED': True}):
+            get_model_or_404(Car, number=4211)
+            #As another process would, with only the shared tier to go on
+            modelcache.get_cache(Car).entries.clear()
+            get_collection(Car).update({'number': 4211},
+                                       {'$set': {'route': 510}}, safe=True)
+            self.assertEquals(get_model_or_404(Car, number=4211).route, 511)
+
+            modelcache.clear(Car)
+            self.assertEquals(get_model_or_404(Car, number=4211).route, 510)
+            modelcache.clear(Car)
+
+    def tearDown(self):
+        self.temporary_settings.__exit__(None, None, None)
+        modelcache.clear(Car)
+        modelcache.clear(Stop)
@@ -3,3 +3,5 @@ from userprofile import UserProfileTests
 from event import EventTests
 from location import LocationClassTests
 from stop import StopTest
+from trajectory import TrajectoryTests
+from rollup import RollupTests
@@ -1,5 +1,6 @@
 import datetime
 import json
+import threading
 
 from django.test import TestCase
 from django.contrib.auth.models import User
@@ -106,6 +107,68 @@ class CarTests(TestCase):
             self.assertEqual(self.close.owner_fares.revenue, 0)
             self.assertEqual(self.close.owner, None)
 
+    def test_concurrent_buy_backs_credit_once(self):
+        price = 65
+        profile = self.user.get_profile()
+        balance = profile.balance
+        self.close.owner = profile
+        self.close.save()
+        refused = []
+
+        def buy_back():
+            user = User.objects.get(pk=self.user.pk)
+            car = Car.objects.get(pk=self.close.pk)
+            try:
+                car.buy_back(user)
+            except Car.NotAllowedException:
+                refused.append(user)
+
+        def fake_price(*args, **kwargs):
+            return price
+        with temporary_settings({'RULE_GET_STREETCAR_PRICE': fake_price}):
+            threads = [threading.Thread(target=buy_back) for i in range(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(refused), 9)
+        self.assertEqual(UserProfile.objects.get(pk=profile.pk).balance,
+                         balance + price)
+        self.assertIsNone(Car.objects.get(pk=self.close.pk).owner)
+
+    def test_concurrent_sales_charge_one_buyer(self):
+        price = 65
+        buyers = [User.objects.create(username='buyer%d' % i)
+                  for i in range(10)]
+        balance = buyers[0].get_profile().balance
+        refused = []
+
+        def sell_to(buyer):
+            user = User.objects.get(pk=buyer.pk)
+            car = Car.objects.get(pk=self.close.pk)
+            try:
+                car.sell_to(user)
+            except Car.NotAllowedException:
+                refused.append(user)
+
+        def fake_price(*args, **kwargs):
+            return price
+        with temporary_settings({'RULE_GET_STREETCAR_PRICE': fake_price}):
+            threads = [threading.Thread(target=sell_to, args=(buyer,))
+                       for buyer in buyers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(refused), 9)
+        owner = Car.objects.get(pk=self.close.pk).owner
+        for buyer in buyers:
+            expected = balance - price if buyer == owner.user else balance
+            self.assertEqual(UserProfile.objects.get(user=buyer).balance,
+                             expected)
+
     def test_buy_back_creates_event(self):
         self.close.owner = self.user.get_profile()
         self.close.save()
@@ -130,6 +193,7 @@ class CarTests(TestCase):
     def test_ride_insufficient_fare_throws_exception(self):
         profile = self.user.get_profile()
         profile.balance = 0
+        profile.save()
         with self.assertRaises(UserProfile.InsufficientFundsException):
             self.close.ride(self.user,
                             self.bathurst_station,
@@ -140,6 +204,7 @@ class CarTests(TestCase):
         offset = 10
         profile = self.user.get_profile()
         profile.balance = fare + offset
+        profile.save()
         owner_profile = self.user2.get_profile()
         self.close.owner_fares = FareInfo()
         self.close.owner = owner_profile
@@ -148,6 +213,7 @@ class CarTests(TestCase):
         original_revenue = 15
         self.close.total_fares = FareInfo(riders=original_riders,
                                           revenue=original_revenue)
+        self.close.save()
 
         def fake_fare(*args, **kwargs):
             return fare
@@ -170,6 +236,47 @@ class CarTests(TestCase):
         self.assertEqual(self.close.total_fares.revenue,
                         original_revenue + fare)
 
+    def test_concurrent_rides_lose_no_updates(self):
+        fare = 3
+        affordable = 15
+        riders = 20
+        profile = self.user.get_profile()
+        profile.balance = fare * affordable
+        profile.save()
+        self.close.owner = self.user2.get_profile()
+        self.close.save()
+        owner_balance = self.user2.get_profile().balance
+
+        refused = []
+
+        def ride():
+            #Every rider works on its own copies, as separate requests would
+            user = User.objects.get(pk=self.user.pk)
+            car = Car.objects.get(pk=self.close.pk)
+            try:
+                car.ride(user, self.bathurst_station, self.bathurst_and_king)
+            except UserProfile.InsufficientFundsException:
+                refused.append(user)
+
+        def fake_fare(*args, **kwargs):
+            return fare
+        with temporary_settings({'RULE_FIND_FARE': fake_fare}):
+            threads = [threading.Thread(target=ride) for i in range(riders)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(refused), riders - affordable)
+        self.assertEqual(UserProfile.objects.get(pk=profile.pk).balance, 0)
+        self.assertEqual(
+            UserProfile.objects.get(pk=self.close.owner.pk).balance,
+            owner_balance + fare * affordable)
+        car = Car.objects.get(pk=self.close.pk)
+        for fare_info in (car.owner_fares, car.total_fares):
+            self.assertEqual(fare_info.riders, riders)
+            self.assertEqual(fare_info.revenue, fare * affordable)
+
     def test_ride_creates_event(self):
         #Ensure no fare issues
         self.close.owner = self.user.get_profile()
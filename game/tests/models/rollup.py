@@ -0,0 +1,68 @@
+import datetime
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from game.models import Car, Stop, Event, Rollup
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.rider = User.objects.create(username='joe',
+                                         email='joe@bloggs.com',
+                                         password='secret')
+        self.owner = User.objects.create(username='heidi',
+                                         email='heidi@yahoo.com',
+                                         password='idieh')
+        self.car = Car.objects.create(number=4211,
+                                      route=511,
+                                      active=True,
+                                      location=[-79.402858, 43.644075],)
+        self.on = Stop.objects.create(number='00112',
+                                      route=511,
+                                      location=[-79.411286, 43.666532],)
+        self.off = Stop.objects.create(number='04412',
+                                       route=511,
+                                       location=[-79.402858, 43.644075],)
+        self.since = datetime.datetime.now() - datetime.timedelta(hours=1)
+
+    def test_events_rolled_up(self):
+        Event.objects.add_car_bought(self.car, self.owner, 200)
+        for fare in (5, 7):
+            Event.objects.add_car_ride(self.rider, self.owner, self.car,
+                                       self.on, self.off, fare)
+        traveled = self.on.distance_to(self.off) * 2
+
+        for kind, key in (('car', 4211), ('route', 511),
+                          ('owner', self.owner.id)):
+            totals = Rollup.objects.totals(kind, [key], self.since)[key]
+            self.assertEquals(totals['riders'], 2)
+            self.assertEquals(totals['revenue'], 12)
+            self.assertAlmostEquals(totals['traveled'], traveled)
+            self.assertEquals(totals['purchases'], 1)
+            self.assertEquals(totals['sales'], 0)
+
+        self.assertEquals(Rollup.objects.totals('car', [4212], self.since),
+                          {4212: dict.fromkeys(('riders', 'revenue',
+                                                'traveled', 'purchases',
+                                                'sales'), 0)})
+
+    def test_series_by_hour(self):
+        start = datetime.datetime(2012, 1, 10, 8, 0)
+        documents = [{'event': 'car_ride',
+                      'date': start + datetime.timedelta(minutes=minutes),
+                      'data': {'car': 4211, 'route': 511, 'fare': 3,
+                               'traveled': 1.5}}
+                     for minutes in (5, 50, 70)]
+        documents.append({'event': 'car_sold', 'date': start,
+                          'data': {'car': 4211, 'route': 511,
+                                   'user': self.owner.id}})
+        self.assertEquals(Rollup.objects.apply_events(documents), 5)
+
+        series = list(Rollup.objects.series('car', 4211, start,
+                                            start + datetime.timedelta(1)))
+        self.assertEquals([rollup.hour for rollup in series],
+                          [start, start + datetime.timedelta(hours=1)])
+        self.assertEquals([rollup.riders for rollup in series], [2, 1])
+        self.assertEquals([rollup.revenue for rollup in series], [6, 3])
+        self.assertEquals([rollup.sales for rollup in series], [1, 0])
@@ -0,0 +1,67 @@
+import datetime
+import threading
+import time
+
+from django.test import TestCase
+
+from game.models import Car, Trajectory
+from game.tests.utils import temporary_settings
+
+
+class TrajectoryTests(TestCase):
+    def setUp(self):
+        self.car = Car.objects.create(number=4069,
+                                      route=505,
+                                      location=[-79.4, 43.6],
+                                      active=True)
+        self.start = int(time.time()) - 3600
+
+    def append(self, count, size=4):
+        with temporary_settings({'CAR_TRAJECTORY_SIZE': size}):
+            for i in range(count):
+                Trajectory.objects.append_fixes(
+                    [{'number': self.car.number, 'location': [i, -i]}],
+                    self.start + i * 60)
+
+    def window(self, first_minute, last_minute):
+        start = datetime.datetime.fromtimestamp(self.start + first_minute * 60)
+        end = datetime.datetime.fromtimestamp(self.start + last_minute * 60)
+        return self.car.trajectory(start, end)
+
+    def test_no_trajectory_is_empty(self):
+        self.assertEquals(self.window(0, 60), [])
+
+    def test_fixes_returned_oldest_first(self):
+        self.append(3)
+        fixes = self.window(0, 60)
+        self.assertEquals([(lon, lat) for time, lon, lat in fixes],
+                          [(0, 0), (1, -1), (2, -2)])
+
+    def test_buffer_keeps_newest_fixes(self):
+        self.append(7)
+        fixes = self.window(0, 60)
+        self.assertEquals([lon for time, lon, lat in fixes], [3, 4, 5, 6])
+
+        trajectory = Trajectory.objects.get(number=self.car.number)
+        self.assertEquals(len(trajectory.fixes), 4 * 3)
+        self.assertEquals(trajectory.head, 7)
+
+    def test_window_filters_fixes(self):
+        self.append(4)
+        self.assertEquals([lon for time, lon, lat in self.window(1, 2)],
+                          [1, 2])
+
+    def test_concurrent_appends_claim_their_own_slots(self):
+        self.append(1, size=40)
+        with temporary_settings({'CAR_TRAJECTORY_SIZE': 40}):
+            threads = [threading.Thread(
+                        target=Trajectory.objects.append_fixes,
+                        args=([{'number': self.car.number,
+                                'location': [i, -i]}], self.start + i * 60))
+                       for i in range(1, 20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        fixes = self.window(0, 60)
+        self.assertEquals(sorted(lon for time, lon, lat in fixes), range(20))
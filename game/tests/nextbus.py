@@ -0,0 +1,31 @@
+import os
+from StringIO import StringIO
+
+from django.test import TestCase
+
+from game.nextbus import iter_vehicles
+
+XML_FILE = (os.path.dirname(__file__) +
+            '/management/commands/test-updatecars.xml')
+
+
+class IterVehiclesTests(TestCase):
+    def vehicles(self, route_list):
+        with open(XML_FILE) as source:
+            return list(iter_vehicles(source, route_list))
+
+    def test_only_listed_routes_returned(self):
+        vehicles = self.vehicles(("501", "511"))
+        self.assertItemsEqual([v['number'] for v in vehicles], [4095, 4212])
+
+    def test_vehicle_data_correct(self):
+        vehicle, = self.vehicles(("501",))
+        self.assertEquals(vehicle, {'number': 4095,
+                                    'route': 501,
+                                    'location': [-79.445847, 43.638817]})
+
+    def test_unpredictable_vehicles_skipped(self):
+        with open(XML_FILE) as source:
+            feed = source.read().replace('predictable="true"',
+                                         'predictable="false"', 1)
+        self.assertEquals(list(iter_vehicles(StringIO(feed), ("94",))), [])
@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from django.test import TestCase
+from pymongo.errors import AutoReconnect
+
+from game.models import Car
+from game.poller import CarPoller
+from game.spatial import car_index
+from game.util import get_collection
+from game.tests.utils import temporary_settings
+
+FEED_FILE = (os.path.dirname(__file__) +
+             '/management/commands/test-updatecars-lasttime.xml')
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """ Stands in for NextBus, serving the recorded feed """
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        if self.path in self.server.failing:
+            self.send_error(500)
+            return
+        if self.path in self.server.slow:
+            time.sleep(2)
+        with open(FEED_FILE) as feed:
+            body = feed.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FeedServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class CarPollerTests(TestCase):
+    def setUp(self):
+        self.server = FeedServer(('127.0.0.1', 0), FeedHandler)
+        self.server.paths = []
+        self.server.failing = []
+        self.server.slow = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+        url = 'http://127.0.0.1:%d/feed?r={route}&t={last_time}' % (
+                                                self.server.server_port)
+        self.temporary_settings = temporary_settings(
+                                {'NEXTBUS_API_URL': url,
+                                 'NEXTBUS_ROUTE_LIST': ("501", "511"),
+                                 'NEXTBUS_POLL_INTERVAL': 20,
+                                 'NEXTBUS_POLL_MIN_INTERVAL': 10,
+                                 'NEXTBUS_POLL_MAX_INTERVAL': 60})
+        with self.temporary_settings:
+            self.poller = CarPoller()
+
+    def test_run_polls_incrementally(self):
+        results = []
+        sleeps = []
+        self.poller.run(cycles=2,
+                        report=lambda result, interval: results.append(result),
+                        sleep=sleeps.append)
+
+        self.assertEquals(self.server.paths, ['/feed?r=%&t=0',
+                                              '/feed?r=%&t=1326218733112'])
+        self.assertEquals(len(sleeps), 1)
+        self.assertEquals(Car.objects.count(), 2)
+        self.assertTrue(results[0]['full'])
+        self.assertFalse(results[1]['full'])
+        self.assertEquals(results[1]['skipped'], 2)
+
+    def test_poll_reports_timings(self):
+        result = self.poller.poll()
+        for stage in ('fetch', 'parse', 'write'):
+            self.assertGreaterEqual(result[stage], 0)
+
+    def test_interval_adapts_to_changes(self):
+        result = self.poller.poll()
+        self.assertEquals(self.poller.next_interval(result), 10)
+        result = self.poller.poll()
+        self.assertEquals(self.poller.next_interval(result), 15)
+
+    def test_incremental_polls_back_off_when_few_cars_change(self):
+        self.poller.poll()
+        #The rest of the fleet, which doesn't report in incremental polls
+        for number in range(40):
+            self.poller.positions[number] = (501, -79.4, 43.6)
+        intervals = []
+        for i in range(2):
+            #Both cars that report have moved since
+            get_collection(Car).update({'number': {'$in': [4095, 4212]}},
+                                       {'$set': {'location': [-79.0, 43.0]}},
+                                       multi=True, safe=True)
+            result = self.poller.poll()
+            self.assertFalse(result['full'])
+            self.assertEquals(result['moved'], 2)
+            intervals.append(self.poller.next_interval(result))
+        self.assertEquals(intervals, [30, 45])
+
+    def test_feed_down_backs_off(self):
+        self.server.shutdown()
+        self.server.server_close()
+        results = []
+        self.poller.run(cycles=1,
+                        report=lambda result, interval: results.append(
+                                                        (result, interval)))
+        self.assertIsInstance(results[0][0], IOError)
+        self.assertEquals(results[0][1], 60)
+
+    def test_bad_url_reported(self):
+        with temporary_settings({'NEXTBUS_API_URL': '/not/a/url'}):
+            poller = CarPoller()
+        results = []
+        poller.run(cycles=1,
+                   report=lambda result, interval: results.append(result))
+        self.assertIsInstance(results[0], IOError)
+        self.assertIn('Bad NextBus URL', str(results[0]))
+
+    def test_database_down_backs_off(self):
+        def poll():
+            raise AutoReconnect('connection refused')
+        self.poller.poll = poll
+        results = []
+        self.poller.run(cycles=2,
+                        report=lambda result, interval: results.append(
+                                                        (result, interval)),
+                        sleep=lambda interval: None)
+        self.assertEquals(len(results), 2)
+        self.assertIsInstance(results[1][0], AutoReconnect)
+        self.assertEquals(results[1][1], 60)
+
+    def parallel_poller(self):
+        with temporary_settings({'NEXTBUS_PARALLEL_ROUTES': True,
+                                 'NEXTBUS_FETCH_THREADS': 2}):
+            with self.temporary_settings:
+                poller = CarPoller()
+        self.addCleanup(poller.close)
+        return poller
+
+    def test_parallel_fetches_each_route(self):
+        result = self.parallel_poller().poll()
+        self.assertItemsEqual(self.server.paths, ['/feed?r=501&t=0',
+                                                  '/feed?r=511&t=0'])
+        self.assertItemsEqual(result['routes'].keys(), ['501', '511'])
+        self.assertItemsEqual(result['cars'], [4095, 4212])
+        self.assertEquals(Car.objects.count(), 2)
+
+    def test_parallel_failed_route_left_alone(self):
+        for number, route in ((4111, 501), (4112, 511)):
+            Car.objects.create(number=number, route=route,
+                               location=(0, 0), active=True)
+        self.server.failing = ['/feed?r=511&t=0']
+
+        result = self.parallel_poller().poll()
+        self.assertEquals(result['failed'], ['511'])
+        self.assertEquals(result['deactivated'], 1)
+        self.assertFalse(Car.objects.get(number=4111).active)
+        self.assertTrue(Car.objects.get(number=4112).active)
+
+    def test_parallel_slow_route_times_out(self):
+        self.server.slow = ['/feed?r=511&t=0']
+        with temporary_settings({'NEXTBUS_FETCH_TIMEOUT': 0.5}):
+            poller = self.parallel_poller()
+        start = time.time()
+        result = poller.poll()
+        self.assertLess(time.time() - start, 2)
+        self.assertEquals(result['failed'], ['511'])
+
+    def test_close_stops_fetch_threads(self):
+        poller = self.parallel_poller()
+        poller.poll()
+        threads = poller.pool._pool
+        poller.close()
+        self.assertIsNone(poller.pool)
+        self.assertFalse([thread for thread in threads if thread.is_alive()])
+
+    def test_poll_publishes_car_index(self):
+        Car.objects.create(number=4111, route=501, location=(0, 0),
+                           active=True)
+        with self.temporary_settings:
+            poller = CarPoller()
+        poller.poll()
+        cars = car_index.nearest([-79.44, 43.63], 501, 10)
+        self.assertEquals([car.number for car in cars], [4095])
+
+    def test_positions_seeded_from_snapshot(self):
+        Car.objects.create(number=4111, route=501, location=(0, 0),
+                           active=True)
+        car_index.publish({4112: (511, -79.4, 43.6)})
+        with self.temporary_settings:
+            poller = CarPoller()
+        self.assertEquals(poller.positions, {4112: (511, -79.4, 43.6)})
+
+        car_index.clear()
+        with self.temporary_settings:
+            poller = CarPoller()
+        self.assertEquals(poller.positions, {4111: (501, 0, 0)})
+
+    def tearDown(self):
+        car_index.clear()
+        self.server.shutdown()
+        self.server.server_close()
@@ -1,8 +1,16 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
 
+from game import metrics
 from game.models import Car, Stop, UserProfile
-from game.rules import find_fare, get_streetcar_price, can_buy_car
+from game.rules import (find_fare, get_streetcar_price, can_buy_car,
+                        get_rule, registry)
+from game.tests.utils import temporary_settings
+
+
+def free_car(user, car):
+    return 0
 
 
 class RulesTest(TestCase):
@@ -57,3 +65,34 @@ class RulesTest(TestCase):
         self.assertTrue(can_buy_car(self.user, self.alrv))
         self.alrv.owner = self.user.get_profile()
         self.assertFalse(can_buy_car(self.user, self.alrv))
+
+
+class RuleRegistryTest(TestCase):
+    def test_rules_resolved_once(self):
+        registry.reload()
+        rule = registry.get('RULE_GET_STREETCAR_PRICE')
+        self.assertIs(rule, get_streetcar_price)
+        self.assertIs(registry.get('RULE_GET_STREETCAR_PRICE'), rule)
+
+    def test_temporary_settings_reload_rules(self):
+        with temporary_settings(
+                {'RULE_GET_STREETCAR_PRICE': 'game.tests.rules.free_car'}):
+            self.assertEquals(
+                get_rule('RULE_GET_STREETCAR_PRICE', None, None), 0)
+        self.assertEquals(get_rule('RULE_GET_STREETCAR_PRICE', None, None),
+                          200)
+
+    def test_bad_rule_fails_on_load(self):
+        with temporary_settings({'RULE_CAN_BUY_CAR': 'game.rules.nothing'}):
+            self.assertRaises(ImproperlyConfigured, registry.get,
+                              'RULE_FIND_FARE')
+        self.assertRaises(ImproperlyConfigured, registry.get, 'RULE_NOTHING')
+
+    def test_timed_rules(self):
+        metrics.reset()
+        with temporary_settings({'TIME_RULES': True}):
+            get_rule('RULE_GET_STREETCAR_PRICE', None, None)
+            get_rule('RULE_GET_STREETCAR_PRICE', None, None)
+        timer = metrics.snapshot()['timers']['rule.RULE_GET_STREETCAR_PRICE']
+        self.assertEquals(timer['calls'], 2)
+        self.assertGreaterEqual(timer['seconds'], 0)
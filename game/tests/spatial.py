@@ -0,0 +1,176 @@
+import json
+import random
+import time
+
+from django.test import TestCase
+from django.core.urlresolvers import reverse
+
+from game import metrics
+from game.models import Car, Stop
+from game.spatial import (GridIndex, stop_index, stop_search_cache,
+                          car_index)
+from game.tests.utils import temporary_settings
+from game.tests.views.api.common import ApiTests
+
+
+class GridIndexTests(TestCase):
+    def test_nearest_matches_brute_force(self):
+        rand = random.Random(0)
+        points = [((rand.uniform(-79.6, -79.2), rand.uniform(43.58, 43.8)), i)
+                  for i in range(500)]
+        index = GridIndex(points, 0.01)
+        self.assertEquals(len(index), 500)
+
+        for i in range(20):
+            lon, lat = rand.uniform(-79.7, -79.1), rand.uniform(43.5, 43.9)
+            by_distance = sorted(points, key=lambda point:
+                                 (point[0][0] - lon) ** 2 +
+                                 (point[0][1] - lat) ** 2)
+            self.assertEquals(index.nearest((lon, lat), 10),
+                              [value for loc, value in by_distance[:10]])
+
+    def test_nearest_with_few_points(self):
+        index = GridIndex([((0, 0), 'a'), ((1, 1), 'b')], 0.01)
+        self.assertEquals(index.nearest((0.9, 0.9), 5), ['b', 'a'])
+        self.assertEquals(GridIndex([], 0.01).nearest((0, 0), 5), [])
+
+
+class StopIndexTests(TestCase):
+    loc = [-79.39812, 43.65201]
+
+    def setUp(self):
+        self.stop1 = Stop.objects.create(location=[-79.39770, 43.65307],
+                                         number='05112',
+                                         route=512)
+        self.stop2 = Stop.objects.create(location=[-79.40230, 43.65201],
+                                         number='20541',
+                                         route=511)
+
+    def test_index_matches_mongo(self):
+        self.assertEquals(stop_index.nearest(self.loc, 10),
+                          list(Stop.objects.find_nearby(self.loc)[:10]))
+
+    def test_saving_stop_updates_index(self):
+        stop_index.nearest(self.loc, 10)
+        closest = Stop.objects.create(location=self.loc, number='00001',
+                                      route=512)
+        self.assertEquals(stop_index.nearest(self.loc, 1), [closest])
+
+    def test_disabled_index_falls_back_to_mongo(self):
+        with temporary_settings({'STOP_INDEX': False}):
+            self.assertIsNone(stop_index.nearest(self.loc, 10))
+            response = self.client.get(reverse('stop-find',
+                                               args=(self.loc[1],
+                                                     self.loc[0])))
+        data = json.loads(response.content)
+        self.assertEquals([stop['number'] for stop in data],
+                          [self.stop1.number, self.stop2.number])
+
+
+class StopSearchCacheTests(ApiTests):
+    loc = [-79.39812, 43.65201]
+
+    def setUp(self):
+        super(StopSearchCacheTests, self).setUp()
+        metrics.reset()
+        self.stop = Stop.objects.create(location=[-79.39770, 43.65307],
+                                        number='05112',
+                                        route=512)
+        self.url = reverse('stop-find', args=(self.loc[1], self.loc[0]))
+
+    def search(self, location):
+        self.searched.append(location)
+        return ['result']
+
+    def test_searches_cached_per_cell(self):
+        self.searched = []
+        with temporary_settings({'STOP_SEARCH_CELL_SIZE': 0.001}):
+            for location in ([-79.3981, 43.6521], [-79.3989, 43.6528]):
+                self.assertEquals(
+                    stop_search_cache.lookup(location, 5, self.search),
+                    ['result'])
+            self.assertEquals(len(self.searched), 1)
+            self.assertAlmostEquals(self.searched[0][0], -79.3985)
+            self.assertAlmostEquals(self.searched[0][1], 43.6525)
+
+            stop_search_cache.lookup([-79.3979, 43.6521], 5, self.search)
+            stop_search_cache.lookup([-79.3981, 43.6521], 3, self.search)
+        self.assertEquals(len(self.searched), 3)
+        self.assertEquals(metrics.snapshot()['counters'],
+                          {'stop_search.hits': 1, 'stop_search.misses': 3})
+
+    def test_least_recently_used_evicted(self):
+        self.searched = []
+        locations = ([0.0005, 0.0005], [0.0015, 0.0005], [0.0025, 0.0005])
+        with temporary_settings({'STOP_SEARCH_CELL_SIZE': 0.001,
+                                 'STOP_SEARCH_CACHE_SIZE': 2}):
+            for location in locations + locations[:1]:
+                stop_search_cache.lookup(location, 5, self.search)
+        self.assertEquals(len(self.searched), 4)
+
+    def test_stop_changes_clear_cache(self):
+        first = json.loads(self.client.get(self.url).content)
+        closest = Stop.objects.create(location=self.loc, number='00001',
+                                      route=512)
+        data = json.loads(self.client.get(self.url).content)
+        self.assertEquals([stop['number'] for stop in first], ['05112'])
+        self.assertEquals(data[0]['number'], closest.number)
+        self.assertEquals(data[0]['url'], reverse('stop', args=('00001',)))
+
+    def test_metrics_staff_only(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.api_name = 'metrics'
+        self.assertStatusCode(self._make_get(), 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        data = json.loads(self._make_get().content)
+        self.assertEquals(data['counters'],
+                          {'stop_search.hits': 1, 'stop_search.misses': 1})
+
+
+class CarIndexTests(ApiTests):
+    api_name = 'stop'
+
+    def setUp(self):
+        super(CarIndexTests, self).setUp()
+        self.stop = Stop.objects.create(number="00258",
+                                        location=[-79.411286, 43.666532],
+                                        route=511)
+        #Not in the snapshot, so only MongoDB knows about it
+        Car.objects.create(number=4213, route=511, active=True,
+                           location=[-79.4110, 43.66449])
+        self.positions = {4211: (511, -79.4065, 43.66449),
+                          4212: (511, -79.39951, 43.63651),
+                          4123: (510, -79.4112, 43.6665)}
+
+    def test_nearest_by_route(self):
+        car_index.publish(self.positions)
+        cars = car_index.nearest(self.stop.location, 511, 10)
+        self.assertEquals([car.number for car in cars], [4211, 4212])
+        self.assertEquals(cars[0].location, [-79.4065, 43.66449])
+        self.assertEquals(car_index.nearest(self.stop.location, 501, 10), [])
+
+    def test_stale_snapshot_not_used(self):
+        car_index.publish(self.positions, time.time() - 600)
+        with temporary_settings({'CAR_INDEX_MAX_AGE': 300}):
+            self.assertIsNone(car_index.nearest(self.stop.location, 511, 10))
+
+    def test_stop_view_reads_index(self):
+        car_index.publish(self.positions)
+        data = json.loads(self._make_get((self.stop.number,)).content)
+        self.assertEquals([car['number'] for car in data['cars_nearby']],
+                          [4211, 4212])
+        self.assertLess(data['cars_age'], 60)
+
+    def test_stop_view_without_snapshot_uses_mongo(self):
+        data = json.loads(self._make_get((self.stop.number,)).content)
+        self.assertEquals([car['number'] for car in data['cars_nearby']],
+                          [4213])
+        self.assertNotIn('cars_age', data)
+
+    def tearDown(self):
+        car_index.clear()
+        super(CarIndexTests, self).tearDown()
+
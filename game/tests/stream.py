@@ -0,0 +1,102 @@
+import json
+import time
+
+from django.core.urlresolvers import reverse
+
+from game.models import Car, UserProfile
+from game.spatial import car_index
+from game.stream import CarStream
+from game.tests.utils import temporary_settings
+from game.tests.views.api.common import ApiTests
+
+
+def parse_events(chunks):
+    return [json.loads(chunk.split('data: ')[1]) for chunk in chunks
+            if chunk.startswith('id: ')]
+
+
+class CarStreamTests(ApiTests):
+    def setUp(self):
+        super(CarStreamTests, self).setUp()
+        self.now = 0
+        #Published one at a time as the stream sleeps
+        self.snapshots = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        if self.snapshots:
+            car_index.publish(self.snapshots.pop(0), time.time() + self.now)
+
+    def stream(self, **kwargs):
+        with temporary_settings({'CAR_STREAM_INTERVAL': 1,
+                                 'CAR_STREAM_KEEPALIVE': 15,
+                                 'CAR_STREAM_MAX_AGE': 3,
+                                 'CAR_INDEX_CHECK_INTERVAL': 0}):
+            return list(CarStream(sleep=self.sleep, clock=self.clock,
+                                  **kwargs))
+
+    def test_sends_moves_and_removals(self):
+        car_index.publish({4211: (511, -79.4065, 43.66449),
+                           4212: (511, -79.39951, 43.63651),
+                           4123: (510, -79.4112, 43.6665)})
+        self.snapshots = [{4211: (511, -79.4060, 43.66449),
+                           4212: (511, -79.39951, 43.63651)}]
+        chunks = self.stream(numbers=[4211, 4212])
+        self.assertEquals(chunks[0], 'retry: 1000\n\n')
+
+        first, second = parse_events(chunks)
+        self.assertEquals(sorted(first['cars']),
+                          [[4211, -79.4065, 43.66449, 511],
+                           [4212, -79.39951, 43.63651, 511]])
+        self.assertEquals(first['removed'], [])
+        self.assertEquals(second['cars'], [[4211, -79.4060, 43.66449, 511]])
+        self.assertEquals(second['removed'], [])
+        self.assertGreater(second['version'], first['version'])
+
+        self.snapshots = [{4212: (511, -79.39951, 43.63651)}]
+        car_index.publish({4211: (511, -79.4060, 43.66449),
+                           4212: (511, -79.39951, 43.63651)})
+        first, second = parse_events(self.stream(numbers=[4211, 4212]))
+        self.assertEquals(second, {'version': second['version'],
+                                   'cars': [], 'removed': [4211]})
+
+    def test_bbox(self):
+        car_index.publish({4211: (511, -79.4065, 43.66449),
+                           4212: (511, -79.39951, 43.63651)})
+        events = parse_events(self.stream(bbox=[-79.41, 43.66, -79.40, 43.67]))
+        self.assertEquals(len(events), 1)
+        self.assertEquals(events[0]['cars'], [[4211, -79.4065, 43.66449, 511]])
+
+    def test_keepalive_without_changes(self):
+        car_index.publish({4211: (511, -79.4065, 43.66449)})
+        with temporary_settings({'CAR_STREAM_KEEPALIVE': 1}):
+            chunks = list(CarStream(numbers=[4211], sleep=self.sleep,
+                                    clock=self.clock))
+        self.assertIn(': keepalive\n\n', chunks)
+
+    def test_ends_without_snapshot(self):
+        chunks = self.stream(numbers=[4211])
+        self.assertEquals(chunks, ['retry: 1000\n\n', 'retry: 15000\n\n'])
+        self.assertEquals(self.now, 0)
+
+    def test_view(self):
+        Car.objects.create(number=4211, route=511, active=True,
+                           location=[-79.4065, 43.66449],
+                           owner=UserProfile.objects.get(user=self.user))
+        self.client.login(username='apitest', password='secret')
+        response = self.client.get(reverse('fleet-stream'),
+                                   {'bbox': '-79.41,43.66,-79.40'})
+        self.assertEquals(response.status_code, 400)
+
+        car_index.publish({4211: (511, -79.4065, 43.66449)})
+        with temporary_settings({'CAR_STREAM_MAX_AGE': 0}):
+            response = self.client.get(reverse('fleet-stream'))
+        self.assertEquals(response['Content-Type'], 'text/event-stream')
+        self.assertEquals(response['Cache-Control'], 'no-cache')
+
+    def tearDown(self):
+        car_index.clear()
+        super(CarStreamTests, self).tearDown()
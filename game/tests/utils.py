@@ -1,4 +1,7 @@
 from django.conf import settings
+from django.db.models.signals import post_init
+
+from game.rules import registry
 
 
 class temporary_settings:
@@ -10,7 +13,31 @@ class temporary_settings:
         for key, value in self.dic.items():
             self.old_values[key] = getattr(settings, key)
             setattr(settings, key, value)
+        self.reload_rules()
 
     def __exit__(self, type, value, traceback):
         for key, value in self.old_values.items():
             setattr(settings, key, value)
+        self.reload_rules()
+
+    def reload_rules(self):
+        if any(key.startswith('RULE_') or key == 'TIME_RULES'
+               for key in self.dic):
+            registry.reload()
+
+
+class count_instances:
+    """ Counts the instances of model loaded or created inside the block """
+    def __init__(self, model):
+        self.model = model
+        self.count = 0
+
+    def __enter__(self):
+        post_init.connect(self.created, sender=self.model)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        post_init.disconnect(self.created, sender=self.model)
+
+    def created(self, **kwargs):
+        self.count += 1
@@ -1,3 +1,5 @@
 from car import *
 from user import *
 from stop import *
+from export import *
+from apitoken import *
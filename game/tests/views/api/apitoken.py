@@ -0,0 +1,65 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+
+from game.authentication import token_cache
+from game.models import ApiToken
+from game.tests.utils import count_instances, temporary_settings
+from game.tests.views.api.common import ApiTests
+
+
+class TokenApiTests(ApiTests):
+    api_name = 'user-token'
+
+    def setUp(self):
+        super(TokenApiTests, self).setUp()
+        token_cache.clear()
+
+    def issue(self):
+        response = self._make_post()
+        self.assertStatusCode(response, 200)
+        return 'Token ' + json.loads(response.content)['token']
+
+    def get_user(self, auth):
+        return self.client.get(reverse('user'), HTTP_AUTHORIZATION=auth)
+
+    def test_token_authenticates(self):
+        auth = self.issue()
+        response = self.get_user(auth)
+        self.assertStatusCode(response, 200)
+        self.assertEquals(json.loads(response.content)['username'],
+                          self.user.username)
+        self.assertStatusCode(self.get_user('Token nonsense'), 403)
+
+    def test_known_token_checked_in_memory(self):
+        auth = self.issue()
+        self.get_user(auth)
+        with count_instances(ApiToken) as tokens:
+            with count_instances(User) as users:
+                self.assertStatusCode(self.get_user(auth), 200)
+        self.assertEquals(tokens.count, 0)
+        self.assertEquals(users.count, 0)
+
+    def test_revoked_token_refused(self):
+        auth = self.issue()
+        self.get_user(auth)
+        response = self.client.delete(reverse(self.api_name),
+                                      HTTP_AUTHORIZATION=auth)
+        self.assertStatusCode(response, 200)
+        self.assertStatusCode(self.get_user(auth), 403)
+        self.assertEquals(ApiToken.objects.count(), 0)
+
+    def test_expired_token_refused(self):
+        with temporary_settings({'API_TOKEN_LIFETIME': -1}):
+            auth = self.issue()
+        self.assertStatusCode(self.get_user(auth), 403)
+
+    def test_revoke_needs_token(self):
+        response = self.client.delete(reverse(self.api_name),
+                                      HTTP_AUTHORIZATION=self.auth_string)
+        self.assertStatusCode(response, 400)
+
+    def tearDown(self):
+        token_cache.clear()
+        super(TokenApiTests, self).tearDown()
@@ -1,13 +1,19 @@
 from base64 import b64encode
 import json
+import time
 
 
 from django.test import TestCase
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from pymongo.objectid import ObjectId
 
+from game import modelcache
 from game.models import Car, Stop, UserProfile, Event
+from game.spatial import car_index
+from game.util import get_collection
 from game.tests.utils import temporary_settings
+from game.tests.views.api.common import ApiTests
 
 
 class CarApiTests(TestCase):
@@ -215,6 +221,36 @@ class CarApiTests(TestCase):
         self.car = Car.objects.get(id=self.car.id)
         self.assertIsNone(self.car.owner)
 
+    def change_owner_elsewhere(self, profile):
+        #Cache the car in this process, then change its owner as another
+        #process would, without this one's cache hearing about it
+        modelcache.clear(Car)
+        self.client.get(reverse(self.timeline_name, args=(self.car.number,)))
+        owner_id = ObjectId(profile.pk) if profile is not None else None
+        get_collection(Car).update({'_id': ObjectId(self.car.pk)},
+                                   {'$set': {'owner_id': owner_id}},
+                                   safe=True)
+
+    def test_sell_with_cache_sees_new_owner(self):
+        balance = self.user.get_profile().balance
+        with temporary_settings({'MODEL_CACHE_SIZE': 10}):
+            self.change_owner_elsewhere(self.user2.get_profile())
+            self.assertStatusCode(self.sell_name, self.car.number, code=403)
+        self.assertEquals(UserProfile.objects.get(user=self.user).balance,
+                          balance)
+        self.assertEquals(Car.objects.get(pk=self.car.pk).owner,
+                          self.user2.get_profile())
+
+    def test_buy_with_cache_sees_new_owner(self):
+        self.car.owner = self.user.get_profile()
+        self.car.save()
+        balance = self.user.get_profile().balance
+        with temporary_settings({'MODEL_CACHE_SIZE': 10}):
+            self.change_owner_elsewhere(None)
+            self.assertStatusCode(self.buy_name, self.car.number, code=403)
+        self.assertEquals(UserProfile.objects.get(user=self.user).balance,
+                          balance)
+
     def test_timeline_api_404_on_invalid_car(self):
         response = self.client.get(reverse(self.timeline_name, args=(0,)))
         self.assertEquals(response.status_code, 404)
@@ -243,7 +279,143 @@ class CarApiTests(TestCase):
             expected_events.remove(event['event'])
             self.assertEquals(event['user'], self.user.username)
 
+    def test_timeline_pages(self):
+        for i in range(5):
+            Event.objects.add_car_ride(self.user, None, self.car,
+                                       self.stop, self.stop, i)
+
+        url = reverse(self.timeline_name, args=(self.car.number,))
+        url += '?limit=2'
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEquals(response.status_code, 200)
+            pages.append(json.loads(response.content))
+            link = response.get('Link')
+            url = link and link[1:link.index('>')]
+        self.assertEquals([len(page) for page in pages], [2, 2, 1])
+
+    def test_timeline_invalid_cursor_gives_400(self):
+        url = reverse(self.timeline_name, args=(self.car.number,))
+        for after in ('yesterday', '2012-01-01T00:00:00.000000_0'):
+            response = self.client.get(url, {'after': after})
+            self.assertEquals(response.status_code, 400)
+
+    def test_timeline_fetches_users_once(self):
+        for i in range(10):
+            Event.objects.add_car_bought(self.car, self.user, 0, self.user2)
+            Event.objects.add_car_ride(self.user2, self.user, self.car,
+                                       self.stop, self.stop, 0)
+        Event.objects.add_car_sold(self.car, self.user, 0)
+
+        #One query for the events and one for their users
+        with self.assertNumQueries(2):
+            events = list(Event.objects.get_car_timeline(self.car))
+        self.assertEquals(len(events), 21)
+        for event in events:
+            if event.event == 'car_ride':
+                self.assertEquals(event.data['rider'], self.user2)
+            else:
+                self.assertEquals(event.data['user'], self.user)
+
     def tearDown(self):
         # Because it's important that there only ever be one user by this
         # this username, we delete when we're finished
         self.user.delete()
+
+
+class CarBoxTests(ApiTests):
+    api_name = 'car-box'
+    bbox = '-79.42,43.66,-79.40,43.67'
+
+    def setUp(self):
+        super(CarBoxTests, self).setUp()
+        self.now = time.time()
+        self.positions = {4211: (511, -79.4065, 43.66449),
+                          4212: (511, -79.39951, 43.63651),
+                          4123: (510, -79.4112, 43.6665)}
+
+    def get(self, **params):
+        params.setdefault('bbox', self.bbox)
+        response = self.client.get(reverse(self.api_name), params)
+        self.assertStatusCode(response, 200)
+        return json.loads(response.content)
+
+    def publish(self, seconds):
+        car_index.publish(self.positions, self.now + seconds)
+
+    def test_cars_in_box(self):
+        self.publish(0)
+        data = self.get()
+        self.assertEquals(data['version'], int(self.now * 1000))
+        self.assertIsNone(data['since'])
+        cars = sorted(zip(data['number'], data['lon'], data['lat'],
+                          data['route']))
+        self.assertEquals(cars, [(4123, -79.4112, 43.6665, 510),
+                                 (4211, -79.4065, 43.66449, 511)])
+        self.assertEquals(data['removed'], [])
+
+    def test_changes_since(self):
+        self.publish(0)
+        version = self.get()['version']
+
+        #4211 moves, 4123 goes out of service and 4212 comes into view
+        self.positions[4211] = (511, -79.4060, 43.66449)
+        self.positions[4212] = (511, -79.4100, 43.6650)
+        del self.positions[4123]
+        self.publish(10)
+        data = self.get(since=version)
+        self.assertEquals(data['since'], version)
+        self.assertEquals(sorted(data['number']), [4211, 4212])
+        self.assertEquals(data['removed'], [4123])
+
+        #Nothing changed since the last one
+        data = self.get(since=data['version'])
+        self.assertEquals(data['number'], [])
+        self.assertEquals(data['removed'], [])
+
+        #4212 leaves the box
+        self.positions[4212] = (511, -79.39951, 43.63651)
+        self.publish(20)
+        data = self.get(since=data['version'])
+        self.assertEquals(data['number'], [])
+        self.assertEquals(data['removed'], [4212])
+
+    def test_changes_tracked_across_pollers(self):
+        self.publish(0)
+        version = self.get()['version']
+        #A poller run for one poll starts without the last one's snapshot
+        car_index.current = None
+        self.positions[4211] = (511, -79.4060, 43.66449)
+        self.publish(10)
+        data = self.get(since=version)
+        self.assertEquals(data['since'], version)
+        self.assertEquals(data['number'], [4211])
+
+    def test_unknown_since_lists_everything(self):
+        self.publish(0)
+        data = self.get(since=int(self.now * 1000) - 1)
+        self.assertIsNone(data['since'])
+        self.assertEquals(sorted(data['number']), [4123, 4211])
+
+    def test_without_snapshot_uses_mongo(self):
+        Car.objects.create(number=4213, route=511, active=True,
+                           location=[-79.4110, 43.66449])
+        Car.objects.create(number=4214, route=511, active=False,
+                           location=[-79.4110, 43.66449])
+        data = self.get(since=1)
+        self.assertIsNone(data['version'])
+        self.assertEquals(data['number'], [4213])
+        self.assertEquals(data['route'], [511])
+
+    def test_invalid(self):
+        self.assertStatusCode(self.client.get(reverse(self.api_name)), 400)
+        for params in ({'bbox': '-79.42,43.66,-79.40'},
+                       {'bbox': '-79.40,43.66,-79.42,43.67'},
+                       {'bbox': self.bbox, 'since': 'x'}):
+            self.assertStatusCode(
+                self.client.get(reverse(self.api_name), params), 400)
+
+    def tearDown(self):
+        car_index.clear()
+        super(CarBoxTests, self).tearDown()
@@ -0,0 +1,63 @@
+import gzip
+import json
+from StringIO import StringIO
+
+from django.core.urlresolvers import reverse
+
+from game.models import Car, Event
+from game.tests.views.api.common import ApiTests
+
+
+class EventExportTests(ApiTests):
+    api_name = 'event-export'
+
+    def setUp(self):
+        super(EventExportTests, self).setUp()
+        self.user.is_staff = True
+        self.user.save()
+        self.car = Car.objects.create(number=4211, route=511, active=True,
+                                      location=[-79.402858, 43.644075])
+        self.car2 = Car.objects.create(number=4212, route=511, active=True,
+                                       location=[-79.402858, 43.644075])
+        Event.objects.all().delete()
+        self.events = [Event.objects.add_car_bought(car, self.user, price)
+                       for price in range(3) for car in (self.car, self.car2)]
+        Event.objects.add_car_sold(self.car, self.user, 10)
+
+    def export(self, **params):
+        response = self.client.get(reverse(self.api_name), params,
+                                   HTTP_AUTHORIZATION=self.auth_string)
+        self.assertStatusCode(response, 200)
+        content = response.content
+        if params.get('gzip'):
+            self.assertEquals(response['Content-Encoding'], 'gzip')
+            content = gzip.GzipFile(fileobj=StringIO(content)).read()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_filters(self):
+        self.assertEquals(len(self.export()), 7)
+        lines = self.export(car=4211, event='car_bought')
+        self.assertEquals([line['data']['price'] for line in lines],
+                          [0, 1, 2])
+        self.assertEquals(lines[0]['id'], self.events[0].id)
+        self.assertEquals(len(self.export(start='2000-01-01',
+                                          end='2000-01-02')), 0)
+
+    def test_export_resumes_from_cursor(self):
+        lines = self.export()
+        rest = self.export(after=lines[2]['cursor'])
+        self.assertEquals([line['id'] for line in rest],
+                          [line['id'] for line in lines[3:]])
+
+    def test_gzip_export(self):
+        self.assertEquals(self.export(gzip=1), self.export())
+
+    def test_export_staff_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertStatusCode(self._make_get(), 403)
+
+    def test_bad_filter_gives_400(self):
+        response = self.client.get(reverse(self.api_name), {'car': 'x'},
+                                   HTTP_AUTHORIZATION=self.auth_string)
+        self.assertStatusCode(response, 400)
@@ -1,5 +1,8 @@
 from djangorestframework.response import ErrorResponse
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, router
+
+from game.modelcache import CACHED_MODELS, lookup
 
 
 def get_key_or_400(querydict, value):
@@ -10,9 +13,34 @@ def get_key_or_400(querydict, value):
 
 
 def get_model_or_404(model, *args, **kwargs):
+    """
+    Lookups by number go through the model cache, which other processes may
+    not have caught up with for MODEL_CACHE_TTL seconds after a write. Use
+    load_model_or_404 for an instance that's about to be changed.
+    """
+    field = CACHED_MODELS.get(model._meta.object_name)
+    if not args and kwargs.keys() == [field]:
+        try:
+            return lookup(model, kwargs[field])
+        except ObjectDoesNotExist:
+            raise _not_found(model)
+    return load_model_or_404(model, *args, **kwargs)
+
+
+def load_model_or_404(model, *args, **kwargs):
+    """ Like get_model_or_404, but always read from the database """
     try:
         return model.objects.get(*args, **kwargs)
     except ObjectDoesNotExist:
-        raise ErrorResponse(404,
-                            {'detail': '{model} not found'.format(
+        raise _not_found(model)
+
+
+def _not_found(model):
+    return ErrorResponse(404, {'detail': '{model} not found'.format(
                                                  model=model.__name__)})
+
+
+def get_collection(model):
+    """ The raw pymongo collection backing a model, for bulk operations """
+    connection = connections[router.db_for_write(model)]
+    return connection.get_collection(model._meta.db_table)
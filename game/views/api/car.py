@@ -1,12 +1,17 @@
+from urllib import urlencode
+
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.conf import settings
 from djangorestframework.views import View
-from djangorestframework.response import ErrorResponse
+from djangorestframework.response import Response, ErrorResponse
 
-from game.util import get_model_or_404, get_key_or_400
-from game.models import Stop, Car, UserProfile, Event
+from game.util import get_model_or_404, get_key_or_400, load_model_or_404
+from game.identity import get_profile
+from game.models import Stop, Car, UserProfile, Event, timeline_cursor
 from game.views.api.common import AuthRequiredView
 from game.rules import get_rule
+from game.spatial import car_index, parse_bbox
 
 
 class CarCheckInView(AuthRequiredView):
@@ -16,7 +21,7 @@ class CarCheckInView(AuthRequiredView):
             stop_number = get_key_or_400(request.POST, 'stop_number')
             stop = get_model_or_404(Stop, number=stop_number)
 
-            userprofile = self.user.get_profile()
+            userprofile = get_profile(self.user)
             userprofile.check_in(car, stop)
             return {'status': 'ok'}
 
@@ -26,10 +31,10 @@ class CheckOutView(AuthRequiredView):
         stop_number = get_key_or_400(request.POST, 'stop_number')
         stop = get_model_or_404(Stop, number=stop_number)
         try:
-            profile = self.user.get_profile()
+            profile = get_profile(self.user)
             if profile.riding:
                 car = profile.riding.car
-            fare = self.user.get_profile().check_out(stop)
+            fare = profile.check_out(stop)
             dic = {'fare': fare}
             if get_rule('RULE_CAN_BUY_CAR', self.user, car):
                 dic['purchase'] = {
@@ -44,7 +49,8 @@ class CheckOutView(AuthRequiredView):
 
 class CarSellView(AuthRequiredView):
     def post(self, request, number):
-        car = get_model_or_404(Car, number=number)
+        #The owner has to be current, not what the cache remembers
+        car = load_model_or_404(Car, number=number)
 
         try:
             car.sell_to(self.user)
@@ -59,7 +65,8 @@ class CarSellView(AuthRequiredView):
 
 class CarBuyView(AuthRequiredView):
     def post(self, request, number):
-        car = get_model_or_404(Car, number=number)
+        #The owner has to be current, not what the cache remembers
+        car = load_model_or_404(Car, number=number)
 
         try:
            # import pdb; pdb.set_trace()
@@ -74,14 +81,74 @@ class CarBuyView(AuthRequiredView):
 class CarTimelineView(View):
     def get(self, request, number):
         car = get_model_or_404(Car, number=number)
+        try:
+            limit = int(request.GET.get('limit',
+                                        settings.TIMELINE_PAGE_LIMIT))
+        except ValueError:
+            raise ErrorResponse(400, {'detail': 'Invalid limit'})
+        limit = max(1, min(limit, settings.TIMELINE_MAX_LIMIT))
 
-        for event in Event.objects.get_car_timeline(car):
+        try:
+            events = list(Event.objects.get_car_timeline(
+                                car, request.GET.get('after'), limit))
+        except ValueError:
+            raise ErrorResponse(400, {'detail': 'Invalid cursor'})
+
+        timeline = []
+        for event in events:
             if event.event == 'car_ride':
                 user = event.data.get('rider')
             else:
                 user = event.data.get('user')
 
             if user:
-                yield {'user': user.username,
-                       'event': event.event,
-                       'date': event.date}
+                timeline.append({'user': user.username,
+                                 'event': event.event,
+                                 'date': event.date})
+
+        #A full page may not be the last, so link to the next one
+        headers = {}
+        if len(events) == limit:
+            query = urlencode({'after': timeline_cursor(events[-1]),
+                               'limit': limit})
+            headers['Link'] = '<%s?%s>; rel="next"' % (request.path, query)
+        return Response(200, timeline, headers)
+
+
+class CarBoxView(View):
+    """
+    The active cars in bbox as parallel lists of number, lon, lat and route.
+    Given the version of an earlier response as since, only the cars that
+    changed after it are listed, and removed has the numbers to take off
+    the map; since is null in the response when everything was listed.
+    """
+    def get(self, request):
+        try:
+            bbox = parse_bbox(get_key_or_400(request.GET, 'bbox'))
+        except ValueError:
+            raise ErrorResponse(400, {'detail': 'Invalid bbox'})
+        since = request.GET.get('since')
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                raise ErrorResponse(400, {'detail': 'Invalid version'})
+
+        dic = {'number': [], 'lon': [], 'lat': [], 'route': [],
+               'removed': []}
+        found = car_index.in_bbox(bbox, since)
+        if found is None:
+            dic['version'] = dic['since'] = None
+            cars = [(car['number'], car['location'], car.get('route'))
+                    for car in Car.objects.find_in_bbox(bbox)]
+        else:
+            dic['version'], dic['since'], positions, dic['removed'] = found
+            cars = [(car.number, car.location, car.route)
+                    for car in positions]
+
+        for number, location, route in cars:
+            dic['number'].append(number)
+            dic['lon'].append(location[0])
+            dic['lat'].append(location[1])
+            dic['route'].append(route)
+        return dic
@@ -3,7 +3,9 @@ from djangorestframework.views import View, ModelView
 from djangorestframework.permissions import IsAuthenticated
 from djangorestframework.authentication import BasicAuthentication
 
+from game.authentication import TokenAuthentication
+
 
 class AuthRequiredView(View, AuthMixin):
-    authentication = (BasicAuthentication,)
+    authentication = (TokenAuthentication, BasicAuthentication)
     permissions = (IsAuthenticated,)
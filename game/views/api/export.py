@@ -0,0 +1,34 @@
+from django.http import HttpResponse
+from djangorestframework.permissions import IsAdminUser
+from djangorestframework.response import ErrorResponse
+
+from game.export import find_events, gzipped, ndjson, parse_date
+from game.views.api.common import AuthRequiredView
+
+
+class EventExportView(AuthRequiredView):
+    permissions = (IsAdminUser,)
+
+    def get(self, request):
+        try:
+            start, end = [parse_date(request.GET[name])
+                          if request.GET.get(name) else None
+                          for name in ('start', 'end')]
+            car = request.GET.get('car')
+            if car is not None:
+                car = int(car)
+            documents = find_events(start, end,
+                                    request.GET.getlist('event'),
+                                    car, request.GET.get('after'))
+        except ValueError as e:
+            raise ErrorResponse(400, {'detail': str(e)})
+
+        #An iterator, so the events are sent as they're read
+        chunks = ndjson(documents)
+        compress = request.GET.get('gzip')
+        if compress:
+            chunks = gzipped(chunks)
+        response = HttpResponse(chunks, content_type='application/x-ndjson')
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        return response
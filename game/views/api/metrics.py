@@ -0,0 +1,11 @@
+from djangorestframework.permissions import IsAdminUser
+
+from game import metrics
+from game.views.api.common import AuthRequiredView
+
+
+class MetricsView(AuthRequiredView):
+    permissions = (IsAdminUser,)
+
+    def get(self, request):
+        return metrics.snapshot()
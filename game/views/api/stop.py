@@ -6,7 +6,9 @@ from django.core.urlresolvers import reverse
 
 from game.models import Stop, Car
 from game.util import get_model_or_404
-from game.resources import StopFindResource
+from game.identity import get_profile
+from game.resources import StopFindResource, stop_find_data
+from game.spatial import stop_index, stop_search_cache, car_index
 from game.views.api.common import AuthRequiredView
 
 
@@ -19,7 +21,14 @@ class StopFindView(View, ListModelMixin):
         except ValueError:
             raise ErrorResponse(400, {'detail': 'Invalid Coordinates'})
 
-        return Stop.objects.find_nearby(location)[:settings.STOP_SEARCH_LIMIT]
+        limit = settings.STOP_SEARCH_LIMIT
+
+        def search(location):
+            stops = stop_index.nearest(location, limit)
+            if stops is None:
+                stops = Stop.objects.find_nearby(location)[:limit]
+            return [stop_find_data(stop) for stop in stops]
+        return stop_search_cache.lookup(location, limit, search)
 
 
 class StopView(AuthRequiredView):
@@ -31,13 +40,18 @@ class StopView(AuthRequiredView):
         for field in self.fields:
             dic[field] = getattr(stop, field)
 
-        if self.user.get_profile().riding != None:
+        profile = get_profile(self.user)
+        if profile.riding != None:
             dic['checkout_url'] = reverse('car-checkout')
         else:
             dic['cars_nearby'] = []
             limit = settings.CAR_SEARCH_LIMIT
-            checked_in = self.user.get_profile().riding != None
-            for car in Car.objects.find_nearby(stop)[:limit]:
+            cars = car_index.nearest(stop.location, stop.route, limit)
+            if cars is None:
+                cars = Car.objects.find_nearby(stop)[:limit]
+            else:
+                dic['cars_age'] = car_index.age()
+            for car in cars:
                 car_dic = {'number': car.number,
                           'location': car.location,
                           'checkin_url': reverse('car-checkin',
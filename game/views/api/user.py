@@ -2,7 +2,10 @@ from djangorestframework.response import ErrorResponse
 from djangorestframework.mixins import InstanceMixin, ReadModelMixin
 from django.core.urlresolvers import reverse
 
+from game.authentication import request_token, token_cache
+from game.models import ApiToken
 from game.util import get_model_or_404
+from game.identity import get_profile
 from game.views.api.common import AuthRequiredView
 from game.resources import UserResource, UserCarResource
 
@@ -16,7 +19,7 @@ class UserView(AuthRequiredView, InstanceMixin):
 
 class UserCarListView(AuthRequiredView):
     def get(self, request):
-        for car in self.user.get_profile().car_set.all():
+        for car in get_profile(self.user).car_set.all():
             yield {'number': car.number,
                    'location': car.location,
                    'timeline_url': reverse('car-timeline', args=(car.number,)),
@@ -31,6 +34,20 @@ class UserCarView(AuthRequiredView, InstanceMixin):
         model_instance = get_model_or_404(model, number=number)
 
         #Only the car's owner can view detailed information
-        if not model_instance.owner == self.user.get_profile():
+        if not model_instance.owner == get_profile(self.user):
             raise ErrorResponse(403, {'detail': 'You do not own this car'})
         return model_instance
+
+
+class TokenView(AuthRequiredView):
+    def post(self, request):
+        key, token = ApiToken.objects.issue(self.user)
+        return {'token': key, 'expires': token.expires}
+
+    def delete(self, request):
+        key = request_token(request)
+        if key is None:
+            raise ErrorResponse(400, {'detail': 'Not using a token'})
+        ApiToken.objects.revoke(key)
+        token_cache.discard(key)
+        return {'status': 'ok'}
@@ -1,21 +1,26 @@
+import datetime
 import json
 
 from django.template.response import TemplateResponse
 from django.contrib.auth.decorators import login_required
-from django.http import Http404
+from django.http import Http404, HttpResponse, HttpResponseBadRequest
 from django.core.urlresolvers import reverse
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.conf import settings
 
-from game.models import Car, Event
+from game.models import Car, Event, Rollup, timeline_cursor
 from game.rules import get_rule
 from game.forms import ProfileForm
+from game.identity import get_profile
+from game.spatial import parse_bbox
+from game.stream import CarStream
 
 
 @login_required
 def fleet_map(request):
     dic = {'selected': 'map'}
-    car_set = request.user.get_profile().car_set.all()
+    car_set = get_profile(request.user).car_set.all()
     dic['cars'] = json.dumps([
                    {'number': car.number,
                    'location': car.location,
@@ -26,12 +31,38 @@ def fleet_map(request):
     return TemplateResponse(request, 'map.html', dic)
 
 
+@login_required
+def fleet_stream(request):
+    """
+    Server-sent events of the positions of the user's cars, or of every car
+    in the bbox (min lon, min lat, max lon, max lat) given
+    """
+    if 'bbox' in request.GET:
+        try:
+            bbox = parse_bbox(request.GET['bbox'])
+        except ValueError:
+            return HttpResponseBadRequest('Invalid bbox')
+        stream = CarStream(bbox=bbox)
+    else:
+        car_set = get_profile(request.user).car_set.all()
+        stream = CarStream(numbers=[car.number for car in car_set])
+    response = HttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
 @login_required
 def fleet(request):
     dic = {'selected': 'fleet'}
-    car_set = request.user.get_profile().car_set.all()
+    car_set = get_profile(request.user).car_set.all()
+    since = datetime.datetime.now() - datetime.timedelta(days=1)
+    recent = Rollup.objects.totals('car', [car.number for car in car_set],
+                                  since)
     dic['cars'] = [{'number': car.number,
-                    'revenue': car.owner_fares.revenue} for car in car_set]
+                    'revenue': car.owner_fares.revenue,
+                    'recent': recent[car.number]} for car in car_set]
+    dic['recent'] = Rollup.objects.totals('owner', [request.user.id],
+                                         since)[request.user.id]
     return TemplateResponse(request, 'fleet.html', dic)
 
 
@@ -41,11 +72,18 @@ def car(request, number):
         car = Car.objects.get(number=number)
     except Car.DoesNotExist:
         raise Http404
-    if not car.owner == request.user.get_profile():
+    if not car.owner == get_profile(request.user):
         messages.error(request, 'Not allowed')
         return redirect('map')
-    events = Event.objects.get_car_timeline(car)
+    limit = settings.TIMELINE_PAGE_LIMIT
+    try:
+        events = list(Event.objects.get_car_timeline(
+                            car, request.GET.get('after'), limit))
+    except ValueError:
+        raise Http404
     dic = {'car': car, 'timeline': events}
+    if len(events) == limit:
+        dic['next_page'] = timeline_cursor(events[-1])
     return TemplateResponse(request, 'car.html', dic)
 
 
@@ -55,7 +93,7 @@ def sell(request, number):
         car = Car.objects.get(number=number)
     except Car.DoesNotExist:
         raise Http404
-    if not car.owner == request.user.get_profile():
+    if not car.owner == get_profile(request.user):
         messages.error(request, 'Not allowed')
         return redirect('map')
     if request.method == 'POST':
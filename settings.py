@@ -59,6 +59,7 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'rockt.game.middleware.ProfileIdentityMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -96,14 +97,112 @@ LOGIN_URL = '/login'
 LOGIN_REDIRECT_URL = '/map'
 
 NEXTBUS_API_URL = ('http://webservices.nextbus.com/service/publicXMLFeed?' +
-                   'command=vehicleLocations&a=ttc&r=%&t=0')
+                   'command=vehicleLocations&a=ttc&r={route}&t={last_time}')
+# Seconds between full downloads of the feed. Polls in between only ask for
+# the vehicles that moved since the feed's last reported time.
+NEXTBUS_RESYNC_INTERVAL = 300
+# Seconds between polls for updatecars --daemon. The interval halves, down to
+# the minimum, when most cars moved in a poll and grows towards the maximum
+# when few did.
+NEXTBUS_POLL_INTERVAL = 15
+NEXTBUS_POLL_MIN_INTERVAL = 10
+NEXTBUS_POLL_MAX_INTERVAL = 60
 NEXTBUS_ROUTE_LIST = [str(num) for num in range(501, 513)]
+# Fetch each route in NEXTBUS_ROUTE_LIST with its own request on a pool of
+# threads, instead of one request for every route in the agency
+NEXTBUS_PARALLEL_ROUTES = False
+NEXTBUS_FETCH_THREADS = 4
+# Seconds a request to NextBus may wait on the connection, and that a poll
+# waits for the routes fetched in parallel before counting the rest failed
+NEXTBUS_FETCH_TIMEOUT = 10
+# Cars that moved less than this many metres since their last write are left
+# alone, unless they changed route or weren't written for CAR_MAX_STALENESS
+# seconds
+CAR_MOVE_THRESHOLD = 15
+CAR_MAX_STALENESS = 300
+# Fixes kept in each car's trajectory, which covers an hour of 15 second polls
+CAR_TRAJECTORY_SIZE = 240
 GTFS_URL = 'http://opendata.toronto.ca/TTC/routes/OpenData_TTC_Schedules.zip'
 INITIAL_BALANCE = 1000
 
+# How distances between stops are measured, see game/distance.py. 'haversine'
+# is a fast spherical approximation, 'ellipsoidal' uses geopy.
+DISTANCE_ENGINE = 'haversine'
+
+# The default cache is left to each deployment, and is only used by the
+# model cache with MODEL_CACHE_SHARED. The poller publishes the car index to
+# the web processes through the CAR_INDEX_CACHE cache, which has to be shared
+# between them, so it needs memcached (and python-memcached) or similar.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'car_index': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+    },
+}
+
 STOP_SEARCH_LIMIT = 10
+# Answer stop searches from an in-memory grid of all the stops, with cells
+# this many degrees wide, instead of MongoDB. The grid is rebuilt when a
+# finished updatestops is noticed, checked every STOP_INDEX_CHECK_INTERVAL
+# seconds.
+STOP_INDEX = True
+STOP_INDEX_CELL_SIZE = 0.01
+STOP_INDEX_CHECK_INTERVAL = 60
+# Stop searches are answered from a cache of STOP_SEARCH_CACHE_SIZE grid
+# cells, STOP_SEARCH_CELL_SIZE degrees wide, with the stops nearest the centre
+# of the cell. 0 turns the cache off.
+STOP_SEARCH_CELL_SIZE = 0.001
+STOP_SEARCH_CACHE_SIZE = 10000
 CAR_SEARCH_LIMIT = 10
-
+# Find the cars near a stop in the snapshot the poller publishes after each
+# poll, instead of MongoDB. Snapshots are looked for in the cache every
+# CAR_INDEX_CHECK_INTERVAL seconds and not used once older than
+# CAR_INDEX_MAX_AGE. CAR_INDEX_CACHE names the cache in CACHES they're
+# published to.
+CAR_INDEX = True
+CAR_INDEX_CACHE = 'car_index'
+CAR_INDEX_CHECK_INTERVAL = 1
+CAR_INDEX_MAX_AGE = 120
+# The fleet map's stream checks the car index every CAR_STREAM_INTERVAL
+# seconds, sends a comment after CAR_STREAM_KEEPALIVE quiet seconds and ends
+# after CAR_STREAM_MAX_AGE, when the browser reconnects.
+CAR_STREAM_INTERVAL = 1
+CAR_STREAM_KEEPALIVE = 15
+CAR_STREAM_MAX_AGE = 300
+
+# Events are inserted in the background, EVENT_BATCH_SIZE at a time as they
+# come in or at least every EVENT_FLUSH_INTERVAL seconds. Past
+# EVENT_QUEUE_SIZE waiting events, requests insert their own. With
+# EVENT_EMITTER_SYNC they're inserted straight away.
+EVENT_EMITTER_SYNC = False
+EVENT_QUEUE_SIZE = 10000
+EVENT_BATCH_SIZE = 500
+EVENT_FLUSH_INTERVAL = 1
+
+# Cars and stops looked up by number are kept for MODEL_CACHE_TTL seconds,
+# up to MODEL_CACHE_SIZE of each per process (0 turns the cache off). With
+# MODEL_CACHE_SHARED they're also kept in CACHES, shared between processes.
+MODEL_CACHE_SIZE = 1000
+MODEL_CACHE_TTL = 5
+MODEL_CACHE_SHARED = False
+
+# API tokens last API_TOKEN_LIFETIME seconds. Each process remembers up to
+# API_TOKEN_CACHE_SIZE tokens in use for API_TOKEN_CACHE_TTL seconds, so a
+# revoked token may still work that long in other processes.
+API_TOKEN_LIFETIME = 30 * 24 * 60 * 60
+API_TOKEN_CACHE_SIZE = 10000
+API_TOKEN_CACHE_TTL = 60
+
+# Car timelines are paged, TIMELINE_PAGE_LIMIT events at a time unless the
+# API asks for up to TIMELINE_MAX_LIMIT
+TIMELINE_PAGE_LIMIT = 50
+TIMELINE_MAX_LIMIT = 500
+
+# Count and time every rule call in the metrics API
+TIME_RULES = False
 RULE_CAN_BUY_CAR = 'game.rules.can_buy_car'
 RULE_FIND_FARE = 'game.rules.find_fare'
 RULE_GET_STREETCAR_PRICE = 'game.rules.get_streetcar_price'
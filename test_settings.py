@@ -0,0 +1,19 @@
+# Settings for running the tests:
+#     python manage.py test game --settings=test_settings
+from settings import *
+
+# Tests read back the events they cause straight away
+EVENT_EMITTER_SYNC = True
+# The database is emptied between tests without any signals, so cached cars
+# and stops would outlive it. Tests of the cache turn it on themselves.
+MODEL_CACHE_SIZE = 0
+# Keep the car index and other cached state to the test process
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'car_index': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'car_index',
+    },
+}
@@ -16,6 +16,8 @@ urlpatterns = patterns('',
          name='logout'),
     url(r'^map/$', 'game.views.web.fleet_map', name='map'),
     url(r'^fleet/$', 'game.views.web.fleet', name='fleet'),
+    url(r'^fleet/stream/$', 'game.views.web.fleet_stream',
+        name='fleet-stream'),
     url(r'^fleet/(?P<number>[^/]+)/$', 'game.views.web.car', name='car'),
     url(r'^fleet/(?P<number>[^/]+)/sell/$',
         'game.views.web.sell',